@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from typing import Any, Hashable
+
+import Clock
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used key and counts hits and misses."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key in self._data:
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+        self.misses += 1
+        return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class TTLCache(LRUCache):
+    """LRUCache whose entries expire ``ttl`` seconds after they were put, unless ``put`` is given a ttl of its own."""
+
+    def __init__(self, max_size: int, ttl: float):
+        super().__init__(max_size)
+        self.ttl = ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = super().get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at <= Clock.monotonic():
+            self.invalidate(key)
+            self.hits -= 1
+            self.misses += 1
+            return default
+        return value
+
+    def put(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        super().put(key, (value, Clock.monotonic() + (self.ttl if ttl is None else ttl)))
@@ -0,0 +1,169 @@
+import asyncio
+import functools
+import selectors
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Coroutine
+
+import pendulum
+from pendulum import DateTime, Timezone
+
+
+class SystemClock:
+    def timestamp(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+
+class VirtualClock:
+    """Time that only moves when ``advance`` is called. Run on a VirtualEventLoop it moves to the next timer whenever the loop is idle."""
+
+    def __init__(self, start: float):
+        self.start = start
+        # Kept apart from the start so that the loop's deadlines don't lose precision to a large epoch
+        self._elapsed = 0.0
+
+    def timestamp(self) -> float:
+        return self.start + self._elapsed
+
+    def monotonic(self) -> float:
+        return self._elapsed
+
+    def advance(self, seconds: float) -> None:
+        self._elapsed += max(0.0, seconds)
+
+    def advance_to(self, monotonic: float) -> None:
+        """Moves the clock to the ``monotonic`` reading exactly, so a timer due then is due, never just short of it."""
+        self._elapsed = max(self._elapsed, monotonic)
+
+
+_clock: SystemClock | VirtualClock = SystemClock()
+
+
+def use(clock: SystemClock | VirtualClock) -> SystemClock | VirtualClock:
+    """Makes ``clock`` the source of time for the scheduling code and returns the previous one."""
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+
+def now(tz: str | Timezone = "UTC") -> DateTime:
+    return pendulum.from_timestamp(_clock.timestamp(), tz=tz)
+
+
+def timestamp() -> float:
+    return _clock.timestamp()
+
+
+def monotonic() -> float:
+    return _clock.monotonic()
+
+
+class _FastForwardSelector:
+    """Wraps a selector so that the loop decides how to wait, see ``VirtualEventLoop._select``."""
+
+    def __init__(self, selector: selectors.BaseSelector, select: Callable[[selectors.BaseSelector, float | None], list]):
+        self._selector = selector
+        self._select = select
+
+    def select(self, timeout: float | None = None):
+        return self._select(self._selector, timeout)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._selector, name)
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop running on a VirtualClock. asyncio.sleep, wait_for and every other timer follow the virtual clock,
+    which jumps to the next timer as soon as no callback is ready, no I/O is waiting and no work handed to another
+    thread (run_in_executor, asyncio.to_thread or a ``thread_work`` block) is pending. I/O that hasn't arrived yet
+    doesn't hold the clock.
+    """
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        self._thread_work = 0
+        super().__init__(_FastForwardSelector(selectors.DefaultSelector(), self._select))
+
+    def time(self) -> float:
+        return self.clock.monotonic()
+
+    def _select(self, selector: selectors.BaseSelector, timeout: float | None) -> list:
+        # The timeout asyncio passes is ignored, it is 0 for a timer a rounding error short of due as well as for ready callbacks
+        if self._ready or self._stopping:
+            return selector.select(0)
+        if self._thread_work:
+            # Time stands still until the other thread delivers, which wakes the selector up
+            return selector.select(None)
+        events = selector.select(0)
+        if events:
+            return events
+        if self._scheduled:
+            self.clock.advance_to(self._scheduled[0].when())
+            return events
+        # No timers, only I/O or another thread can wake the loop up
+        return selector.select(None)
+
+    @contextmanager
+    def thread_work(self):
+        """Holds the clock still for the duration of the block, in which the loop waits for a result from another thread."""
+        self._thread_work += 1
+        try:
+            yield
+        finally:
+            self._thread_work -= 1
+
+    def run_in_executor(self, executor, func, *args) -> asyncio.Future:
+        future = super().run_in_executor(executor, func, *args)
+        self._thread_work += 1
+        future.add_done_callback(self._thread_work_done)
+        return future
+
+    def _thread_work_done(self, _future: asyncio.Future) -> None:
+        self._thread_work -= 1
+
+
+@contextmanager
+def _aiosqlite_thread_work():
+    """aiosqlite runs every call on a thread of its connection rather than an executor, so its calls are counted here."""
+    try:
+        import aiosqlite
+    except ImportError:
+        yield
+        return
+
+    def holding(method):
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            if not isinstance(loop, VirtualEventLoop):
+                return await method(*args, **kwargs)
+            with loop.thread_work():
+                return await method(*args, **kwargs)
+
+        return wrapper
+
+    originals = {name: getattr(aiosqlite.Connection, name) for name in ("_execute", "_connect") if hasattr(aiosqlite.Connection, name)}
+    for name, method in originals.items():
+        setattr(aiosqlite.Connection, name, holding(method))
+    try:
+        yield
+    finally:
+        for name, method in originals.items():
+            setattr(aiosqlite.Connection, name, method)
+
+
+def run_virtual(main: Coroutine, clock: VirtualClock) -> Any:
+    """
+    Runs ``main`` on a VirtualEventLoop driven by ``clock`` and returns its result. The clock can be made current
+    with ``use`` beforehand to prepare data at the start time, it only moves while this runs.
+    """
+    previous = use(clock)
+    try:
+        with _aiosqlite_thread_work(), asyncio.Runner(loop_factory=lambda: VirtualEventLoop(clock)) as runner:
+            return runner.run(main)
+    finally:
+        use(previous)
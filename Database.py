@@ -1,33 +1,418 @@
 import asyncio
-from typing import Self, Sequence, Literal
-
-import pendulum
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+import hashlib
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Self, Sequence, Literal, Callable, Awaitable, Any
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import declarative_base, relationship
-from sqlalchemy import Column, Integer, String, ForeignKey, BLOB, select, Index, insert, update, Boolean, delete, func, and_
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy import Column, Integer, String, ForeignKey, BLOB, select, Index, insert, update, Boolean, delete, func, inspect, text, Row, literal, ColumnElement, event, or_
 
+import Clock
+import Metrics
+import Tracing
+from Cache import LRUCache
 from ReminderTime import ReminderTime
-from constants import UTC_ZONES, DISPATCHER_PERIOD, DATABASE_NAME
+from common import next_daily_fire_at
+from constants import UTC_ZONES, DATABASE_NAME, DATABASE_POOL_SIZE, DATABASE_POOL_OVERFLOW, DATABASE_PRAGMAS, USER_TIMEZONE_CACHE_SIZE, \
+    DATABASE_GROUP_COMMIT_WINDOW, DATABASE_GROUP_COMMIT_MAX, DATABASE_PROFILE, DATABASE_SLOW_QUERY, DATABASE_EXPLAIN
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_NAME}"
-engine = create_async_engine(DATABASE_URL, echo=False)
+
+
+def create_engine(database_url: str = DATABASE_URL, pragmas: dict[str, str | int] = None,
+                  pool_size: int = DATABASE_POOL_SIZE, max_overflow: int = DATABASE_POOL_OVERFLOW) -> AsyncEngine:
+    """
+    Creates an engine with a warm connection pool that applies ``pragmas`` to every new SQLite connection.
+    Connections with the ``read_only`` execution option run their statements without an explicit transaction.
+    """
+    pragmas = DATABASE_PRAGMAS if pragmas is None else pragmas
+    new_engine = create_async_engine(database_url, echo=False, poolclass=AsyncAdaptedQueuePool,
+                                     pool_size=pool_size, max_overflow=max_overflow)
+
+    @event.listens_for(new_engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, _connection_record):
+        # The driver's implicit transactions break SAVEPOINT, so transactions are started explicitly in on_begin
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    @event.listens_for(new_engine.sync_engine, "begin")
+    def on_begin(conn):
+        # A read is one statement, which SQLite runs in a transaction of its own, BEGIN would only add a trip to the driver thread
+        if not conn.get_execution_options().get("read_only"):
+            conn.exec_driver_sql("BEGIN")
+
+    return new_engine
+
+
+engine = create_engine()
 
 Base = declarative_base()
 AsyncSessionMaker = async_sessionmaker(engine, expire_on_commit=False)
+# Sessions of the connection decorator, which only reads
+ReadSessionMaker = async_sessionmaker(engine.execution_options(read_only=True), expire_on_commit=False)
+
+
+_unit_of_work: ContextVar[AsyncSession | None] = ContextVar("unit_of_work", default=None)
+
+
+class ReminderLimitException(Exception):
+    def __init__(self, message: str = None):
+        super().__init__(message)
+
+
+class QueryPlanError(Exception):
+    def __init__(self, message: str = None):
+        super().__init__(message)
+
+
+# Methods run on every dispatch tick or interaction, their statements must find rows through an index
+INDEXED_QUERIES = {
+    "UserDB._fetch_user_timezone", "UserDB.update_user_timezone",
+    "RemindersDB.claim_due", "RemindersDB.delete_fired", "RemindersDB.set_next_fire_at", "RemindersDB.get_upcoming",
+    "RemindersDB.get_by_ids", "RemindersDB.add_reminder", "RemindersDB.get_user_reminders_count", "RemindersDB.get_reminder_by_id",
+    "RemindersDB.get_user_reminders_without_file",
+    "OutboxDB.claim_ready", "OutboxDB.complete", "OutboxDB.get_next_attempt_at", "ScheduleEventDB.get_after",
+}
+
+
+def _parameter_shapes(parameters: Any, limit: int = 10) -> str:
+    """Describes bind parameters by type and size without their values, e.g. ``(int, str[12], bytes[40960])``."""
+    def shape(value: Any) -> str:
+        if isinstance(value, (bytes, memoryview, str)):
+            return f"{type(value).__name__}[{len(value)}]"
+        return type(value).__name__
+
+    values = list(parameters.values() if isinstance(parameters, dict) else parameters or ())
+    shapes = ", ".join(shape(value) for value in values[:limit])
+    return f"({shapes}{f', ... {len(values)} in total' if len(values) > limit else ''})"
+
+
+def _result_size(result: Any) -> tuple[int, int]:
+    """Returns the rows and the bytes of BLOB data in a method's result: a row, model, scalar or a collection of them."""
+    def blob_bytes(row: Any) -> int:
+        if isinstance(row, (bytes, memoryview)):
+            return len(row)
+        values = row if isinstance(row, (tuple, Row)) else vars(row).values() if isinstance(row, Base) else ()
+        return sum(len(value) for value in values if isinstance(value, (bytes, memoryview)))
+
+    if result is None:
+        return 0, 0
+    if isinstance(result, dict):
+        result = list(result.values())
+    if isinstance(result, (list, tuple)) and not isinstance(result, Row):
+        return len(result), sum(blob_bytes(row) for row in result)
+    return 1, blob_bytes(result)
+
+
+class QueryProfiler:
+    """
+    Call statistics of the methods decorated with ``connection`` and ``write_connection``: calls, wall time,
+    rows returned and bytes of BLOB data returned. Calls slower than ``slow_threshold`` are logged with the
+    statements they ran and the shapes of their parameters.
+
+    With ``explain`` every statement is run through EXPLAIN QUERY PLAN first, and one issued by a method in
+    ``indexed`` that scans a whole table raises QueryPlanError. That is meant for tests, not production.
+    """
+
+    def __init__(self, enabled: bool, slow_threshold: float, explain: bool, indexed: set[str]):
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self.explain = explain
+        self.indexed = indexed
+        self.stats: dict[str, dict[str, float]] = {}
+        self.slowest: dict[str, dict] = {}
+        self._current: ContextVar[dict | None] = ContextVar("profiled_call", default=None)
+        self._explained: dict[str, list[str]] = {}
+        self._calls = Metrics.registry.register(Metrics.Counter("database_calls_total", "Profiled database method calls"))
+        self._seconds = Metrics.registry.register(Metrics.Counter("database_call_seconds_total", "Wall time of profiled database method calls"))
+        self._rows = Metrics.registry.register(Metrics.Counter("database_rows_total", "Rows returned by profiled database method calls"))
+        self._blob_bytes = Metrics.registry.register(Metrics.Counter("database_blob_bytes_total", "Bytes of BLOB data returned by profiled calls"))
+        self._slow = Metrics.registry.register(Metrics.Counter("database_slow_calls_total", "Profiled database method calls over the slow threshold"))
+
+    def install(self, target: AsyncEngine) -> None:
+        @event.listens_for(target.sync_engine, "before_cursor_execute")
+        def before_cursor_execute(conn, _cursor, statement, parameters, context, executemany):
+            if (call := self._current.get()) is None:
+                return
+            if self.explain and not executemany:
+                self._check_plan(conn, call["method"], statement, parameters)
+            context.profile_started = time.perf_counter()
+
+        @event.listens_for(target.sync_engine, "after_cursor_execute")
+        def after_cursor_execute(_conn, _cursor, statement, parameters, context, executemany):
+            if (call := self._current.get()) is None or not hasattr(context, "profile_started"):
+                return
+            elapsed = time.perf_counter() - context.profile_started
+            if len(call["statements"]) < 20:
+                shapes = f"{len(parameters)} x {_parameter_shapes(parameters[0])}" if executemany and parameters else _parameter_shapes(parameters)
+                call["statements"].append({"sql": " ".join(statement.split()), "parameters": shapes, "seconds": elapsed})
+
+    def _check_plan(self, conn, method: str, statement: str, parameters: Any) -> None:
+        if not statement.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")):
+            return
+        plan = self._explained.get(statement)
+        if plan is None:
+            cursor = conn.connection.dbapi_connection.cursor()
+            try:
+                cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+                plan = self._explained[statement] = [row[-1] for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+
+        if method in self.indexed:
+            scans = [detail for detail in plan if re.match(r"SCAN (TABLE )?\w+", detail) and " USING " not in detail
+                     and not detail.startswith("SCAN CONSTANT ROW")]
+            if scans:
+                raise QueryPlanError(f"{method} scans a whole table ({'; '.join(scans)}): {' '.join(statement.split())}")
+
+    def wrap(self, method: str, function: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        async def profiled(*args, **kwargs):
+            if not (self.enabled or self.explain):
+                return await function(*args, **kwargs)
+
+            call = {"method": method, "statements": []}
+            token = self._current.set(call)
+            started = time.perf_counter()
+            try:
+                result = await function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                self._current.reset(token)
+            self.record(call, elapsed, result)
+            return result
+
+        return profiled
+
+    def bind(self, operation: Callable[[AsyncSession], Awaitable[Any]]) -> Callable[[AsyncSession], Awaitable[Any]]:
+        """Makes the statements of ``operation`` count towards the current call even when another task runs it."""
+        call = self._current.get()
+        if call is None:
+            return operation
+
+        async def bound(session: AsyncSession):
+            token = self._current.set(call)
+            try:
+                return await operation(session)
+            finally:
+                self._current.reset(token)
+
+        return bound
+
+    def record(self, call: dict, elapsed: float, result: Any) -> None:
+        if not self.enabled:
+            return
+        method = call["method"]
+        rows, blob_bytes = _result_size(result)
+        stats = self.stats.setdefault(method, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "rows": 0, "blob_bytes": 0, "slow_calls": 0})
+        stats["calls"] += 1
+        stats["seconds"] += elapsed
+        stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+        stats["rows"] += rows
+        stats["blob_bytes"] += blob_bytes
+        self._calls.inc(method=method)
+        self._seconds.inc(elapsed, method=method)
+        self._rows.inc(rows, method=method)
+        self._blob_bytes.inc(blob_bytes, method=method)
+
+        if elapsed >= self.slow_threshold:
+            stats["slow_calls"] += 1
+            self._slow.inc(method=method)
+            logger.warning("Slow database call %s took %.3fs, %d rows, %d BLOB bytes:\n%s", method, elapsed, rows, blob_bytes,
+                           "\n".join(f"  {statement['seconds']:.3f}s {statement['sql']} {statement['parameters']}" for statement in call["statements"]))
+        if elapsed > self.slowest.get(method, {}).get("seconds", 0):
+            self.slowest[method] = {"seconds": elapsed, "statements": call["statements"]}
+
+    def snapshot(self) -> dict[str, dict]:
+        """Aggregates per method, slowest total time first, with the statements of each method's slowest call."""
+        return {
+            method: {**stats, "mean_seconds": stats["seconds"] / stats["calls"], "slowest": self.slowest.get(method)}
+            for method, stats in sorted(self.stats.items(), key=lambda item: item[1]["seconds"], reverse=True)
+        }
+
+
+profiler = QueryProfiler(DATABASE_PROFILE, DATABASE_SLOW_QUERY, DATABASE_EXPLAIN, INDEXED_QUERIES)
+profiler.install(engine)
+
+
+def after_commit(session: AsyncSession, callback: Callable[[], None]) -> None:
+    """Runs ``callback`` once the transaction of ``session`` has committed, and not at all if it rolls back."""
+    session.info.setdefault("after_commit", []).append(callback)
+
+
+def _run_after_commit(session: AsyncSession) -> None:
+    for callback in session.info.pop("after_commit", []):
+        try:
+            callback()
+        except Exception:
+            logger.exception("After-commit callback failed")
 
 
 def connection(method):
     async def wrapper(*args, **kwargs):
-        async with AsyncSessionMaker() as session:
+        # Inside unit_of_work() every call shares its session, which commits once at the end
+        if (session := _unit_of_work.get()) is not None:
+            return await method(*args, session=session, **kwargs)
+
+        async with ReadSessionMaker() as session:
             try:
-                return await method(*args, session=session, **kwargs)
+                result = await method(*args, session=session, **kwargs)
+                await session.commit()
+                _run_after_commit(session)
+                return result
             except Exception as e:
                 await session.rollback()
                 raise e
             finally:
                 await session.close()
 
-    return wrapper
+    return profiler.wrap(method.__qualname__, Tracing.wrap(f"db {method.__qualname__}", wrapper))
+
+
+def write_connection(method):
+    # Same as connection, but outside a unit of work the call is queued on the writer and committed with others
+    async def wrapper(*args, **kwargs):
+        if (session := _unit_of_work.get()) is not None:
+            return await method(*args, session=session, **kwargs)
+
+        return await writer.submit(profiler.bind(lambda session: method(*args, session=session, **kwargs)))
+
+    return profiler.wrap(method.__qualname__, Tracing.wrap(f"db {method.__qualname__}", wrapper))
+
+
+class GroupCommitWriter:
+    """
+    Serializes database writes through a single task.
+
+    Operations submitted within ``window`` seconds of each other share one transaction, each inside its own
+    SAVEPOINT, so a failing operation only rolls back itself. Callers get their result, or the exception, once
+    the transaction has committed. The task and its queue are bound to the event loop that first uses them.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker, window: float, max_batch: int):
+        self.window = window
+        self.max_batch = max_batch
+        self._session_maker = session_maker
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue | None = None
+        self._lock: asyncio.Lock | None = None
+        self._task: asyncio.Task | None = None
+
+    def _ensure_running(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._lock = asyncio.Lock()
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    @property
+    def depth(self) -> int:
+        """Writes waiting for the next group commit."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, operation: Callable[[AsyncSession], Awaitable[Any]]) -> Any:
+        self._ensure_running()
+        future = self._loop.create_future()
+        self._queue.put_nowait((operation, future))
+        return await future
+
+    @asynccontextmanager
+    async def exclusive(self):
+        """Holds off group commits for the duration of the block, so that it is the only writer."""
+        self._ensure_running()
+        async with self._lock:
+            yield
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            if self._queue.qsize() < self.max_batch:
+                await asyncio.sleep(self.window)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            async with self._lock:
+                await self._commit(batch)
+
+    async def _commit(self, batch: list[tuple[Callable[[AsyncSession], Awaitable[Any]], asyncio.Future]]) -> None:
+        outcomes = []
+        try:
+            async with self._session_maker() as session:
+                # Decorated methods called by an operation join the batch instead of queueing behind it
+                token = _unit_of_work.set(session)
+                try:
+                    callbacks = session.info.setdefault("after_commit", [])
+                    for operation, future in batch:
+                        if future.cancelled():
+                            continue
+                        registered = len(callbacks)
+                        try:
+                            async with session.begin_nested():
+                                result = await operation(session)
+                            outcomes.append((future, result, None))
+                        except Exception as e:
+                            outcomes.append((future, None, e))
+                            # The operation was rolled back, so are its after-commit callbacks
+                            del callbacks[registered:]
+                        # Operations may bring their own instances of the same rows, so none stay attached
+                        session.expunge_all()
+                    await session.commit()
+                    _run_after_commit(session)
+                finally:
+                    _unit_of_work.reset(token)
+        except Exception as e:
+            # Nothing was committed, every caller that hasn't failed on its own gets the commit error
+            failed = {id(future): error for future, _, error in outcomes if error is not None}
+            outcomes = [(future, None, failed.get(id(future), e)) for _, future in batch]
+
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+writer = GroupCommitWriter(AsyncSessionMaker, DATABASE_GROUP_COMMIT_WINDOW, DATABASE_GROUP_COMMIT_MAX)
+
+
+@asynccontextmanager
+async def unit_of_work():
+    """
+    Runs every database call made inside the block in one session and one transaction.
+    The transaction commits when the block exits and rolls back if it raises. Nested blocks join the outer one.
+    Group commits wait for the block, which keeps a single writer at a time.
+    """
+    if _unit_of_work.get() is not None:
+        yield
+        return
+
+    async with writer.exclusive(), AsyncSessionMaker() as session:
+        token = _unit_of_work.set(session)
+        try:
+            yield
+            await session.commit()
+            _run_after_commit(session)
+        except BaseException:
+            await session.rollback()
+            raise
+        finally:
+            _unit_of_work.reset(token)
 
 
 class UserDB(Base):
@@ -39,31 +424,45 @@ class UserDB(Base):
 
     tz_relation = relationship("TimezoneDB", backref="users")
 
+    timezone_cache: LRUCache = LRUCache(USER_TIMEZONE_CACHE_SIZE)
+
     @classmethod
-    @connection
+    @write_connection
     async def create_user_if_not_exists(cls, discord_id: int, session: AsyncSession):
         stmt = insert(cls).values(discord_id=discord_id).prefix_with("OR IGNORE")
         await session.execute(stmt)
-        await session.commit()
+
+    @classmethod
+    async def get_user_timezone(cls, discord_id: int) -> str | None:
+        """Returns the user's UTC zone name (a key of ``UTC_ZONES``), served from the cache when possible."""
+        tz_name = cls.timezone_cache.get(discord_id)
+        if tz_name is None:
+            tz_name = await cls._fetch_user_timezone(discord_id)
+            if tz_name is not None:
+                cls.timezone_cache.put(discord_id, tz_name)
+        return tz_name
 
     @classmethod
     @connection
-    async def get_user_timezone(cls, discord_id: int, session: AsyncSession) -> "TimezoneBD | None":
+    async def _fetch_user_timezone(cls, discord_id: int, session: AsyncSession) -> str | None:
         result = await session.execute(
-            select(TimezoneDB).join(cls, cls.timezone == TimezoneDB.id).filter(cls.discord_id == discord_id)
+            select(TimezoneDB.tz_name).join(cls, cls.timezone == TimezoneDB.id).filter(cls.discord_id == discord_id)
         )
-        return result.scalars().first()
+        return result.scalar()
 
     @classmethod
-    @connection
+    @write_connection
     async def update_user_timezone(cls, discord_id: int, new_timezone: str, session: AsyncSession) -> None:
+        # The old zone must not be served once the update commits, the new one is cached only after it did
+        cls.timezone_cache.invalidate(discord_id)
         subquery = select(TimezoneDB.id).filter(TimezoneDB.tz_name == new_timezone).scalar_subquery()
-        await session.execute(
+        result = await session.execute(
             update(cls)
             .where(cls.discord_id == discord_id)
             .values(timezone=subquery)
         )
-        await session.commit()
+        if result.rowcount:
+            after_commit(session, lambda: cls.timezone_cache.put(discord_id, new_timezone))
 
 
 class TimezoneDB(Base):
@@ -73,7 +472,7 @@ class TimezoneDB(Base):
     tz_name = Column(String, unique=True, nullable=False)
 
     @classmethod
-    @connection
+    @write_connection
     async def insert_timezones(cls, session: AsyncSession):
         stmt = select(cls).limit(1)
         result = await session.execute(stmt)
@@ -82,7 +481,75 @@ class TimezoneDB(Base):
             return
         timezones = [cls(tz_name=name) for name in UTC_ZONES.keys()]
         session.add_all(timezones)
-        await session.commit()
+
+
+class AttachmentDB(Base):
+    __tablename__ = "Attachments"
+
+    # SHA-256 of the content, identical files uploaded by different reminders are stored once
+    hash = Column(String, primary_key=True, unique=True, nullable=False)
+    data = Column(BLOB, nullable=False)
+    size = Column(Integer, nullable=False)
+    # Downscaled preview shown on the edit page, only for images
+    thumbnail = Column(BLOB)
+    ref_count = Column(Integer, nullable=False, default=0)
+    # Discord CDN link of the last successful upload, reused instead of uploading the data again
+    cdn_url = Column(String)
+    cdn_expires_at = Column(Integer)
+
+    @classmethod
+    async def acquire(cls, data: bytes, thumbnail: bytes | None, session: AsyncSession) -> str:
+        """Stores ``data`` (or adds a reference to an existing copy) within the caller's session and returns its hash."""
+        file_hash = hashlib.sha256(data).hexdigest()
+        stmt = sqlite_insert(cls).values(hash=file_hash, data=data, size=len(data), thumbnail=thumbnail, ref_count=1)
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[cls.hash],
+            set_={"ref_count": cls.ref_count + 1, "thumbnail": func.coalesce(cls.thumbnail, stmt.excluded.thumbnail)}
+        ))
+        return file_hash
+
+    @classmethod
+    async def release(cls, file_hashes: Sequence[str], session: AsyncSession) -> None:
+        """Drops one reference per hash within the caller's session, deleting content nobody refers to anymore."""
+        for file_hash, count in Counter(file_hashes).items():
+            await session.execute(update(cls).where(cls.hash == file_hash).values(ref_count=cls.ref_count - count))
+        await session.execute(delete(cls).where(cls.hash.in_(list(set(file_hashes))), cls.ref_count <= 0))
+
+    @classmethod
+    @connection
+    async def get_data(cls, file_hash: str, session: AsyncSession) -> bytes | None:
+        result = await session.execute(select(cls.data).where(cls.hash == file_hash))
+        return result.scalar()
+
+    @classmethod
+    @connection
+    async def get_thumbnail(cls, file_hash: str, session: AsyncSession) -> bytes | None:
+        result = await session.execute(select(cls.thumbnail).where(cls.hash == file_hash))
+        return result.scalar()
+
+    @classmethod
+    @write_connection
+    async def set_thumbnail(cls, file_hash: str, thumbnail: bytes, session: AsyncSession) -> None:
+        await session.execute(update(cls).where(cls.hash == file_hash).values(thumbnail=thumbnail))
+
+    @classmethod
+    @connection
+    async def get_metadata(cls, file_hashes: Sequence[str], session: AsyncSession) -> dict[str, Row]:
+        """Returns ``hash -> (size, cdn_url, cdn_expires_at)`` without loading the data itself."""
+        result = await session.execute(
+            select(cls.hash, cls.size, cls.cdn_url, cls.cdn_expires_at).where(cls.hash.in_(list(file_hashes)))
+        )
+        return {row.hash: row for row in result.all()}
+
+    @classmethod
+    @write_connection
+    async def set_cdn_url(cls, file_hash: str, cdn_url: str, cdn_expires_at: int | None, session: AsyncSession) -> None:
+        await session.execute(update(cls).where(cls.hash == file_hash).values(cdn_url=cdn_url, cdn_expires_at=cdn_expires_at))
+
+    @classmethod
+    @write_connection
+    async def free(cls, file_hashes: Sequence[str], session: AsyncSession) -> None:
+        await cls.release(file_hashes, session=session)
 
 
 class RemindersDB(Base):
@@ -93,43 +560,61 @@ class RemindersDB(Base):
     user_id = Column(Integer, ForeignKey("Users.discord_id", onupdate="CASCADE", ondelete="RESTRICT"), nullable=False)
     name = Column(String, nullable=False)
     channel_id = Column(Integer, nullable=False)
+    # Date: UTC epoch; Daily: seconds of the day on the wall clock of `timezone`
     timestamp = Column(Integer, nullable=False)
+    # UTC epoch of the next time the reminder fires, advanced after each Daily fire
+    next_fire_at = Column(Integer)
+    timezone = Column(String)
     type = Column(String, nullable=False)
     description = Column(String)
-    file = Column(BLOB)
+    file_hash = Column(String, ForeignKey("Attachments.hash", onupdate="CASCADE", ondelete="RESTRICT"))
     file_name = Column(String)
+    file_size = Column(Integer)
     private = Column(Boolean, nullable=False, default=False)
     link = Column(String)
     mention_role = Column(Integer)
+    # Dispatcher worker sending the reminder right now and when its claim runs out
+    claimed_by = Column(String)
+    lease_until = Column(Integer)
+    # Deliveries in a row that failed because the channel or user is gone or forbidden, and when that disabled the reminder
+    failure_count = Column(Integer)
+    disabled_at = Column(Integer)
 
     user = relationship("UserDB", backref="reminders")
 
-    __table_args__ = (Index('ix_reminders_timestamp_type', 'timestamp', 'type'),)
+    __table_args__ = (Index('ix_reminders_next_fire_at', 'next_fire_at'), Index('ix_reminders_user_id', 'user_id'))
 
-    @connection
+    @write_connection
     async def delete(self, session: AsyncSession):
         await session.delete(self)
-        await session.commit()
+        if self.file_hash:
+            await AttachmentDB.release([self.file_hash], session=session)
 
-    @connection
+    @write_connection
     async def remove_file(self, session: AsyncSession):
-        self.file = None
+        if self.file_hash:
+            await AttachmentDB.release([self.file_hash], session=session)
+        await session.execute(update(RemindersDB).where(RemindersDB.id == self.id).values(file_hash=None, file_name=None, file_size=None))
+        self.file_hash = None
         self.file_name = None
-        await session.commit()
+        self.file_size = None
 
-    @connection
-    async def save(self, session: AsyncSession):
-        if self.id:
-            await session.merge(self)
-        else:
-            session.add(self)
-        await session.commit()
+    @write_connection
+    async def save(self, session: AsyncSession, **values):
+        """
+        Writes only ``values`` to the reminder's row and applies them to this instance. Columns the dispatcher changes
+        meanwhile (next_fire_at, claims, failures) are left as they are unless they are passed.
+        """
+        await session.execute(update(RemindersDB).where(RemindersDB.id == self.id).values(**values))
+        for column, value in values.items():
+            setattr(self, column, value)
 
     @classmethod
-    @connection
+    @write_connection
     async def add_reminder(cls, user_id: int, channel_id: int, time: ReminderTime, name: str, description: str | None,
-                           rem_type: Literal['Daily', 'Date'], link: str, file: bytes | None,
-                           file_name: str, private: bool, mention_role: int | None, session: AsyncSession):
+                           rem_type: Literal['Daily', 'Date'], link: str, file: bytes | None, thumbnail: bytes | None,
+                           file_name: str, private: bool, mention_role: int | None, session: AsyncSession,
+                           limit: int | None = None) -> int:
         """
         Adds a new reminder to the database.
 
@@ -142,63 +627,153 @@ class RemindersDB(Base):
             rem_type (Literal['Daily', 'Date']): The type of the reminder, either 'Daily' or 'Date'.
             link (str): A link associated with the reminder.
             file (bytes | None): An optional file to be sent with the reminder.
+            thumbnail (bytes | None): A downscaled preview of the file if it is an image.
             file_name (str): The name of the file to be sent.
             private (bool): Whether the reminder is private.
             mention_role (int | None): The role to mention when the reminder is sent.
             session (AsyncSession): The database session to use for the operation.
+            limit (int | None): The maximum number of reminders the user may have, checked atomically with the insert.
 
         Returns:
-            None
+            int: The ID of the created reminder.
+
+        Raises:
+            ReminderLimitException: If the user already has ``limit`` reminders.
         """
         user_subquery = select(UserDB.discord_id).where(UserDB.discord_id == user_id).scalar_subquery()
-        insert_stmt = insert(cls).values(
+        file_hash = await AttachmentDB.acquire(file, thumbnail, session=session) if file is not None else None
+        values = dict(
             user_id=user_subquery,
             name=name,
             channel_id=channel_id,
             timestamp=time.bd_timestamp,
+            next_fire_at=time.fire_at,
+            timezone=time.timezone.name,
             type=rem_type,
             description=description,
-            file=file,
+            file_hash=file_hash,
             file_name=file_name,
+            file_size=len(file) if file is not None else None,
             private=private,
             link=link,
             mention_role=mention_role
         )
-        await session.execute(insert_stmt)
-        await session.commit()
+        # INSERT ... SELECT ... WHERE count < limit, so concurrent creates can't both pass the check
+        source = select(*(value if isinstance(value, ColumnElement) else literal(value) for value in values.values()))
+        if limit is not None:
+            source = source.where(select(func.count(cls.id)).where(cls.user_id == user_id).scalar_subquery() < limit)
+
+        result = await session.execute(insert(cls).from_select(list(values), source).returning(cls.id))
+        rem_id = result.scalar()
+        if rem_id is None:
+            raise ReminderLimitException(f"The limit for reminders is {limit}")
+        return rem_id
 
     @classmethod
     @connection
-    async def get_due_and_delete_date(cls, session: AsyncSession) -> Sequence[Self]:
-        current_timestamp = int(pendulum.now("UTC").timestamp())
+    async def get_schedule(cls, session: AsyncSession) -> Sequence[tuple[int, int]]:
+        result = await session.execute(select(cls.id, cls.next_fire_at).where(cls.disabled_at.is_(None)))
+        return result.tuples().all()
 
-        delete_query = (
-            delete(cls)
-            .where(cls.timestamp <= current_timestamp, cls.type == "Date")
+    @classmethod
+    @write_connection
+    async def claim_due(cls, until: int, worker_id: str, lease_until: int, session: AsyncSession, limit: int | None = None) -> Sequence[Self]:
+        """
+        Leases reminders due by ``until`` to ``worker_id`` until ``lease_until`` and returns them, earliest first.
+        Reminders leased to another worker are skipped until that lease has run out, then they are taken over.
+        """
+        claimable = (
+            select(cls.id)
+            .where(cls.next_fire_at <= until, cls.disabled_at.is_(None),
+                   or_(cls.claimed_by.is_(None), cls.claimed_by == worker_id, cls.lease_until < until),
+                   # A Date reminder stays due while its occurrence waits in the outbox
+                   ~select(OutboxDB.id).where(OutboxDB.reminder_id == cls.id, OutboxDB.fire_at == cls.next_fire_at).exists())
+            .order_by(cls.next_fire_at)
+            .limit(limit)
+        )
+        result = await session.scalars(
+            update(cls)
+            .where(cls.id.in_(claimable))
+            .values(claimed_by=worker_id, lease_until=lease_until)
             .returning(cls)
+            .execution_options(synchronize_session=False)
         )
-        result = await session.execute(delete_query)
-        await session.commit()
+        return sorted(result.all(), key=lambda reminder: reminder.next_fire_at)
 
-        return result.scalars().all()
+    @classmethod
+    @write_connection
+    async def release_claims(cls, rem_ids: Sequence[int], worker_id: str, session: AsyncSession) -> None:
+        await session.execute(
+            update(cls).where(cls.id.in_(rem_ids), cls.claimed_by == worker_id).values(claimed_by=None, lease_until=None)
+        )
 
     @classmethod
-    @connection
-    async def get_due_daily(cls, session: AsyncSession) -> Sequence[Self]:
-        current_time = pendulum.now("UTC")
-        today_time = current_time.hour * 3600 + current_time.minute * 60 + current_time.second
-
-        reminders_query = select(cls).where(
-            and_(
-                cls.timestamp >= today_time,
-                cls.timestamp < today_time + DISPATCHER_PERIOD,
-                cls.type == "Daily"
+    @write_connection
+    async def delete_fired(cls, fired: dict[int, int], session: AsyncSession) -> list[str]:
+        """
+        Deletes the Date reminders whose occurrence ``fire_at`` has been sent, unless they were edited to another time since.
+        Their attachments are not released, the returned hashes have to be passed to ``AttachmentDB.free``.
+        """
+        file_hashes = []
+        for rem_id, fire_at in fired.items():
+            result = await session.execute(
+                delete(cls).where(cls.id == rem_id, cls.type == "Date", cls.next_fire_at == fire_at).returning(cls.file_hash)
             )
+            file_hashes.extend(file_hash for file_hash in result.scalars() if file_hash)
+        return file_hashes
+
+    @classmethod
+    @write_connection
+    async def set_next_fire_at(cls, next_fire_at: dict[int, int], worker_id: str, session: AsyncSession) -> list[int]:
+        """
+        Moves reminders still leased to ``worker_id`` to their next fire time and releases the lease.
+        Reminders edited or taken over in the meantime are left alone. Returns the ids that were updated.
+        """
+        updated = []
+        for rem_id, fire_at in next_fire_at.items():
+            result = await session.execute(
+                update(cls)
+                .where(cls.id == rem_id, cls.claimed_by == worker_id)
+                .values(next_fire_at=fire_at, claimed_by=None, lease_until=None)
+            )
+            if result.rowcount:
+                updated.append(rem_id)
+        return updated
+
+    @classmethod
+    @write_connection
+    async def record_failures(cls, rem_ids: Sequence[int], disable_after: int, now: int, session: AsyncSession) -> list[int]:
+        """
+        Counts a failed delivery for each reminder and disables the ones that failed ``disable_after`` times in a row.
+        Returns the ids of the reminders disabled by this call.
+        """
+        await session.execute(update(cls).where(cls.id.in_(rem_ids)).values(failure_count=func.coalesce(cls.failure_count, 0) + 1))
+        result = await session.execute(
+            update(cls)
+            .where(cls.id.in_(rem_ids), cls.failure_count >= disable_after, cls.disabled_at.is_(None))
+            .values(disabled_at=now)
+            .returning(cls.id)
         )
-        result = await session.execute(reminders_query)
-        reminders_to_send = result.scalars().all()
+        return list(result.scalars())
 
-        return reminders_to_send
+    @classmethod
+    @write_connection
+    async def reset_failures(cls, rem_ids: Sequence[int], session: AsyncSession) -> None:
+        await session.execute(update(cls).where(cls.id.in_(rem_ids), cls.failure_count > 0).values(failure_count=0))
+
+    @classmethod
+    @connection
+    async def get_upcoming(cls, after: int, until: int, session: AsyncSession) -> Sequence[Self]:
+        result = await session.execute(
+            select(cls).where(cls.next_fire_at > after, cls.next_fire_at <= until, cls.disabled_at.is_(None))
+        )
+        return result.scalars().all()
+
+    @classmethod
+    @connection
+    async def get_by_ids(cls, rem_ids: Sequence[int], session: AsyncSession) -> dict[int, Self]:
+        result = await session.execute(select(cls).where(cls.id.in_(list(rem_ids))))
+        return {reminder.id: reminder for reminder in result.scalars()}
 
     @classmethod
     @connection
@@ -218,40 +793,199 @@ class RemindersDB(Base):
 
     @classmethod
     @connection
-    async def get_user_reminders_without_file(cls, discord_id: int, session: AsyncSession):
-        result = await session.execute(
-            select(
-                cls.id, cls.user_id, cls.name, cls.channel_id, cls.timestamp,
-                cls.type, cls.description, cls.file_name, cls.private, cls.link, cls.mention_role
-            ).where(cls.user_id == discord_id)
+    async def get_user_reminders_without_file(cls, discord_id: int, session: AsyncSession) -> Sequence[Self]:
+        # File contents live in Attachments, so the rows themselves are small
+        result = await session.execute(select(cls).where(cls.user_id == discord_id))
+        return result.scalars().all()
+
+
+class OutboxDB(Base):
+    __tablename__ = "Outbox"
+
+    # One row per occurrence of a reminder waiting to be sent, removed once Discord has accepted the message
+    id = Column(Integer, primary_key=True, unique=True, nullable=False, autoincrement=True)
+    reminder_id = Column(Integer, nullable=False)
+    fire_at = Column(Integer, nullable=False)
+    # "<reminder id>:<fire_at>", the message nonce is derived from the keys of the occurrences sent together
+    idempotency_key = Column(String, unique=True, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(Integer, nullable=False)
+    last_error = Column(String)
+    claimed_by = Column(String)
+    lease_until = Column(Integer)
+
+    __table_args__ = (Index('ix_outbox_next_attempt_at', 'next_attempt_at'), Index('ix_outbox_fire_at', 'fire_at'), Index('ix_outbox_reminder_id', 'reminder_id'))
+
+    @staticmethod
+    def idempotency_key_for(rem_id: int, fire_at: int) -> str:
+        return f"{rem_id}:{fire_at}"
+
+    @classmethod
+    @write_connection
+    async def enqueue(cls, occurrences: Sequence[tuple[int, int]], now: int, session: AsyncSession) -> None:
+        """Adds ``(reminder_id, fire_at)`` occurrences to send at ``now``, ignoring ones that are already queued."""
+        stmt = sqlite_insert(cls).values([
+            dict(reminder_id=rem_id, fire_at=fire_at, idempotency_key=cls.idempotency_key_for(rem_id, fire_at), attempts=0, next_attempt_at=now)
+            for rem_id, fire_at in occurrences
+        ])
+        await session.execute(stmt.on_conflict_do_nothing(index_elements=[cls.idempotency_key]))
+
+    @classmethod
+    @write_connection
+    async def claim_ready(cls, until: int, worker_id: str, lease_until: int, session: AsyncSession, limit: int | None = None,
+                          fired_after: int | None = None, fired_before: int | None = None, latest_first: bool = False) -> Sequence[Self]:
+        """
+        Leases the occurrences ready to be sent by ``until`` to ``worker_id``, in the same way as ``RemindersDB.claim_due``.
+        Only occurrences with ``fired_after <= fire_at < fired_before`` are claimed, earliest or, with ``latest_first``, least late first.
+        """
+        conditions = [cls.next_attempt_at <= until, or_(cls.claimed_by.is_(None), cls.claimed_by == worker_id, cls.lease_until < until)]
+        if fired_after is not None:
+            conditions.append(cls.fire_at >= fired_after)
+        if fired_before is not None:
+            conditions.append(cls.fire_at < fired_before)
+        order = cls.fire_at.desc() if latest_first else cls.fire_at
+
+        claimable = select(cls.id).where(*conditions).order_by(order).limit(limit)
+        result = await session.scalars(
+            update(cls)
+            .where(cls.id.in_(claimable))
+            .values(claimed_by=worker_id, lease_until=lease_until)
+            .returning(cls)
+            .execution_options(synchronize_session=False)
+        )
+        return sorted(result.all(), key=lambda entry: entry.fire_at, reverse=latest_first)
+
+    @classmethod
+    @write_connection
+    async def renew_leases(cls, entry_ids: Sequence[int], worker_id: str, lease_until: int, session: AsyncSession) -> None:
+        await session.execute(
+            update(cls).where(cls.id.in_(entry_ids), cls.claimed_by == worker_id).values(lease_until=lease_until)
+        )
+
+    @classmethod
+    @write_connection
+    async def complete(cls, entry_ids: Sequence[int], session: AsyncSession) -> None:
+        await session.execute(delete(cls).where(cls.id.in_(entry_ids)))
+
+    @classmethod
+    @write_connection
+    async def retry_later(cls, retries: dict[int, tuple[int, str]], session: AsyncSession) -> None:
+        """Releases failed occurrences until ``next_attempt_at``, given with the error as ``id -> (next_attempt_at, error)``."""
+        for entry_id, (next_attempt_at, error) in retries.items():
+            await session.execute(
+                update(cls)
+                .where(cls.id == entry_id)
+                .values(attempts=cls.attempts + 1, next_attempt_at=next_attempt_at, last_error=error, claimed_by=None, lease_until=None)
+            )
+
+    @classmethod
+    @connection
+    async def count(cls, session: AsyncSession) -> int:
+        result = await session.execute(select(func.count(cls.id)))
+        return result.scalar()
+
+    @classmethod
+    @connection
+    async def get_next_attempt_at(cls, after: int, session: AsyncSession) -> int | None:
+        result = await session.execute(select(func.min(cls.next_attempt_at)).where(cls.next_attempt_at > after))
+        return result.scalar()
+
+
+class ScheduleEventDB(Base):
+    __tablename__ = "ScheduleEvents"
+
+    # Schedule changes made by the bot process, read in id order by dispatchers running in other processes
+    id = Column(Integer, primary_key=True, unique=True, nullable=False, autoincrement=True)
+    reminder_id = Column(Integer, nullable=False)
+    # None when the reminder was deleted
+    fire_at = Column(Integer)
+    created_at = Column(Integer, nullable=False)
+
+    @classmethod
+    @write_connection
+    async def publish(cls, reminder_id: int, fire_at: int | None, session: AsyncSession) -> None:
+        await session.execute(insert(cls).values(reminder_id=reminder_id, fire_at=fire_at, created_at=int(Clock.timestamp())))
+
+    @classmethod
+    @connection
+    async def get_last_id(cls, session: AsyncSession) -> int:
+        result = await session.execute(select(func.max(cls.id)))
+        return result.scalar() or 0
+
+    @classmethod
+    @connection
+    async def get_after(cls, event_id: int, session: AsyncSession) -> Sequence[tuple[int, int, int | None]]:
+        """Returns ``(id, reminder_id, fire_at)`` of every event newer than ``event_id``, oldest first."""
+        result = await session.execute(select(cls.id, cls.reminder_id, cls.fire_at).where(cls.id > event_id).order_by(cls.id))
+        return result.tuples().all()
+
+    @classmethod
+    @write_connection
+    async def prune(cls, before: int, session: AsyncSession) -> None:
+        await session.execute(delete(cls).where(cls.created_at < before))
+
+
+def _add_missing_columns(conn):
+    """Brings tables created by an older version up to date: adds new nullable columns and indexes."""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column.type.compile(conn.dialect)}'))
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+async def _backfill_next_fire_at():
+    now = int(Clock.timestamp())
+    async with AsyncSessionMaker() as session:
+        await session.execute(
+            update(RemindersDB)
+            .where(RemindersDB.next_fire_at.is_(None), RemindersDB.type == "Date")
+            .values(next_fire_at=RemindersDB.timestamp)
         )
+        # Daily reminders created before zones were stored kept UTC seconds of the day
+        legacy_daily = await session.execute(
+            select(RemindersDB.id, RemindersDB.timestamp).where(RemindersDB.next_fire_at.is_(None), RemindersDB.type == "Daily")
+        )
+        rows = [{"id": rem_id, "timezone": "UTC", "next_fire_at": next_daily_fire_at(timestamp, "UTC", after=now)}
+                for rem_id, timestamp in legacy_daily.tuples()]
+        if rows:
+            await session.execute(update(RemindersDB), rows)
+        await session.commit()
+
+
+async def _move_inline_files():
+    """Moves file contents stored inline in Reminders by older versions into Attachments."""
+    async with AsyncSessionMaker() as session:
+        columns = await session.run_sync(lambda sync_session: inspect(sync_session.connection()).get_columns("Reminders"))
+        if "file" not in {column["name"] for column in columns}:
+            return
 
-        reminders = []
-        for row in result.all():
-            reminders.append(
-                cls(
-                    id=row.id,
-                    user_id=row.user_id,
-                    name=row.name,
-                    channel_id=row.channel_id,
-                    timestamp=row.timestamp,
-                    type=row.type,
-                    description=row.description,
-                    file_name=row.file_name,
-                    private=row.private,
-                    link=row.link,
-                    mention_role=row.mention_role,
-                    file=None
-                )
+        result = await session.execute(text('SELECT id FROM "Reminders" WHERE file IS NOT NULL'))
+        for rem_id in result.scalars().all():
+            data = (await session.execute(text('SELECT file FROM "Reminders" WHERE id = :id'), {"id": rem_id})).scalar()
+            file_hash = await AttachmentDB.acquire(data, None, session=session)
+            await session.execute(
+                text('UPDATE "Reminders" SET file = NULL, file_hash = :hash, file_size = :size WHERE id = :id'),
+                {"hash": file_hash, "size": len(data), "id": rem_id}
             )
-        return reminders
+            await session.commit()
 
 
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-        # Insert time zones if they are not yet in the database
-        await TimezoneDB.insert_timezones()
+        await conn.run_sync(_add_missing_columns)
+        # Dispatch watermark of older versions, the schedule runs off next_fire_at now
+        await conn.execute(text('DROP TABLE IF EXISTS "DispatchState"'))
+    await _backfill_next_fire_at()
+    await _move_inline_files()
+    # Insert time zones if they are not yet in the database
+    await TimezoneDB.insert_timezones()
+    # The pool must not carry connections over to the bot's event loop
+    await engine.dispose()
 
 
 asyncio.run(init_db())
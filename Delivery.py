@@ -0,0 +1,149 @@
+import asyncio
+import contextlib
+import random
+from collections import deque
+from typing import Awaitable, Callable, Hashable, Iterable, Any
+
+import Clock
+
+# Tokens short of a whole one by less than this count as whole, refills add up rounding errors
+_EPSILON = 1e-9
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with jitter: a random delay between half and all of ``base * 2 ** (attempt - 1)``, at most ``cap``."""
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return random.uniform(delay / 2, delay)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = Clock.monotonic()
+
+    def _refill(self) -> None:
+        now = Clock.monotonic()
+        # Never negative, a reading from before Clock.use swapped the clock would otherwise drain the bucket
+        self._tokens = min(self.capacity, self._tokens + max(0.0, now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return self._tokens >= self.capacity
+
+    @property
+    def available(self) -> int:
+        """Whole tokens that can be taken right now."""
+        self._refill()
+        return max(0, int(self._tokens + _EPSILON))
+
+    def take(self, count: int) -> None:
+        """Takes ``count`` tokens without waiting, the caller checks ``available`` first."""
+        self._refill()
+        self._tokens -= count
+
+    async def acquire(self) -> None:
+        while True:
+            self._refill()
+            if self._tokens >= 1 - _EPSILON:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def penalize(self, retry_after: float) -> None:
+        """Empties the bucket so that the next token becomes available in ``retry_after`` seconds."""
+        self._refill()
+        self._tokens = min(self._tokens, 1 - retry_after * self.rate)
+
+
+class ByteBudget:
+    """Caps the total size of attachments held by concurrent sends; a single oversized file may still go alone."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    @contextlib.asynccontextmanager
+    async def reserve(self, size: int):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight == 0 or self.in_flight + size <= self.limit)
+            self.in_flight += size
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= size
+                self._condition.notify_all()
+
+
+class DeliveryPool:
+    """
+    Sends a batch of jobs with a bounded number of workers.
+
+    Jobs sharing a destination key run one at a time and in order, paced by a per-destination token bucket,
+    while every request also takes a token from a global bucket. ``retry_after`` maps an exception to
+    ``(seconds, is_global)`` for rate-limit errors and to ``None`` for everything else.
+    """
+
+    def __init__(self, workers: int, global_rate: float, destination_rate: float, destination_burst: int,
+                 retry_after: Callable[[Exception], tuple[float, bool] | None], max_retries: int):
+        self.workers = workers
+        self.destination_rate = destination_rate
+        self.destination_burst = destination_burst
+        self.max_retries = max_retries
+        self._retry_after = retry_after
+        self._global = TokenBucket(global_rate, global_rate)
+        self._buckets: dict[Hashable, TokenBucket] = {}
+
+    async def run(self, jobs: Iterable[tuple[Hashable, Callable[[], Awaitable[Any]]]]) -> list[Any]:
+        """Returns the result of every job in input order, or the exception it finally failed with."""
+        queues: dict[Hashable, deque] = {}
+        count = 0
+        for index, (key, job) in enumerate(jobs):
+            queues.setdefault(key, deque()).append((index, job))
+            count = index + 1
+
+        results: list[Any] = [None] * count
+        ready: asyncio.Queue = asyncio.Queue()
+        for key in queues:
+            ready.put_nowait(key)
+
+        async def worker():
+            while True:
+                try:
+                    key = ready.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                index, job = queues[key].popleft()
+                results[index] = await self._deliver(key, job)
+                if queues[key]:
+                    ready.put_nowait(key)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, len(queues)))))
+        self._prune()
+        return results
+
+    async def _deliver(self, key: Hashable, job: Callable[[], Awaitable[Any]]) -> Any:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.destination_rate, self.destination_burst)
+
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            await self._global.acquire()
+            try:
+                return await job()
+            except Exception as e:
+                retry = self._retry_after(e)
+                if retry is None or attempt == self.max_retries:
+                    return e
+                seconds, is_global = retry
+                (self._global if is_global else bucket).penalize(seconds)
+
+    def _prune(self) -> None:
+        for key in [key for key, bucket in self._buckets.items() if bucket.idle]:
+            del self._buckets[key]
@@ -1,36 +1,528 @@
 import asyncio
+import functools
+import hashlib
 import io
+import logging
+import time
+from typing import Sequence, NamedTuple
 
 import discord
+from sqlalchemy import Row
 
+import Clock
 import Database
+import Metrics
 import constants
-from common import calculate_timestamp_for_discord_footer
+from Cache import TTLCache, LRUCache
+from Delivery import DeliveryPool, ByteBudget, TokenBucket, backoff_delay
+from Scheduler import Scheduler
+from common import calculate_timestamp_for_discord_footer, next_daily_fire_at, is_embed_image, cdn_url_expires_at
 
-from constants import REMINDER_MESSAGE_COLOR, DISPATCHER_PERIOD, EMBED_IMAGE_TYPES
+from constants import REMINDER_MESSAGE_COLOR, CDN_URL_REFRESH_MARGIN, CDN_URL_REFRESH_BATCH, DELIVERY_WORKERS, DELIVERY_GLOBAL_RATE, \
+    DELIVERY_DESTINATION_RATE, DELIVERY_DESTINATION_BURST, DELIVERY_MAX_RETRIES, DELIVERY_INFLIGHT_BYTES, DISPATCH_HEARTBEAT, DISPATCHER_WORKER_ID, DISPATCHER_LEASE, \
+    DISPATCHER_CLAIM_BATCH, SCHEDULE_EVENT_POLL, SCHEDULE_EVENT_RETENTION, DELIVERY_SEND_TIMEOUT, DELIVERY_MAX_ATTEMPTS, DELIVERY_BACKOFF_BASE, \
+    DELIVERY_BACKOFF_CAP, BACKLOG_LATE_THRESHOLD, BACKLOG_DRAIN_RATE, BACKLOG_DRAIN_BURST, BACKLOG_POLICY, BACKLOG_MAX_AGE, BACKLOG_SUMMARY_LINES, \
+    RECIPIENT_CACHE_SIZE, RECIPIENT_CACHE_TTL, RECIPIENT_NEGATIVE_TTL, RECIPIENT_MAX_FAILURES, MESSAGE_MAX_EMBEDS, MESSAGE_MAX_EMBED_CHARS, \
+    MESSAGE_MAX_FILES, MESSAGE_MAX_UPLOAD, PRERENDER_WINDOW, PRERENDER_INTERVAL, PRERENDER_CACHE_SIZE, METRICS_HOST, METRICS_PORT, \
+    METRICS_STALL_AFTER
+
+logger = logging.getLogger(__name__)
+
+FIRE_LATENESS = Metrics.registry.register(Metrics.Histogram(
+    "reminder_fire_lateness_seconds", "Time from a reminder's scheduled fire time to the send that delivered it",
+    [1, 2, 5, 10, 30, 60, 300, 900, 3600, 21600, 86400]
+))
+TICK_DUE = Metrics.registry.register(Metrics.Histogram(
+    "dispatcher_tick_due_reminders", "Due reminders claimed per dispatch tick", [0, 1, 5, 10, 50, 100, 500, 1000, 5000]
+))
+SEND_LATENCY = Metrics.registry.register(Metrics.Histogram(
+    "dispatcher_send_seconds", "Duration of message send requests", [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+))
+SEND_ERRORS = Metrics.registry.register(Metrics.Counter("dispatcher_send_errors_total", "Failed message sends by exception type and HTTP status"))
+REMINDERS_SENT = Metrics.registry.register(Metrics.Counter("dispatcher_reminders_sent_total", "Reminders delivered"))
+SENDS_SAVED = Metrics.registry.register(Metrics.Counter("dispatcher_sends_saved_total", "Sends avoided by packing reminders into shared messages"))
+CDN_URLS_REFRESHED = Metrics.registry.register(Metrics.Counter("dispatcher_cdn_urls_refreshed_total", "Expiring CDN links signed again by Discord"))
+OUTBOX_DEPTH = Metrics.registry.register(Metrics.Gauge("dispatcher_outbox_depth", "Occurrences waiting in the outbox after the last tick"))
+Metrics.registry.register(Metrics.Gauge("dispatcher_scheduled_reminders", "Reminders in the in-memory schedule", lambda: len(Dispatcher.scheduler)))
+Metrics.registry.register(Metrics.Gauge("database_write_queue_depth", "Writes waiting for the next group commit", lambda: Database.writer.depth))
+Metrics.registry.register(Metrics.Gauge("dispatcher_last_tick_timestamp_seconds", "Unix time of the last completed dispatch tick",
+                                        lambda: Dispatcher.last_tick))
+
+
+def rate_limit_retry_after(error: Exception) -> tuple[float, bool] | None:
+    if not isinstance(error, discord.HTTPException) or error.status != 429:
+        return None
+    headers = error.response.headers
+    return float(headers.get("Retry-After", 1)), headers.get("X-RateLimit-Global") == "true"
+
+
+class RecipientUnavailable(Exception):
+    """Raised without a request for a channel or user that recently turned out to be missing or forbidden."""
+
+
+def is_permanent_failure(error: Exception) -> bool:
+    # The channel or user is gone or the bot may not post there, retrying won't help
+    return isinstance(error, (discord.NotFound, discord.Forbidden, RecipientUnavailable))
+
+
+def cdn_url_is_fresh(attachment: Row) -> bool:
+    return bool(attachment.cdn_url) and attachment.cdn_expires_at is not None \
+        and attachment.cdn_expires_at > Clock.timestamp() + CDN_URL_REFRESH_MARGIN
+
+
+async def remember_cdn_urls(uploads: dict[str, str], message: discord.Message) -> None:
+    """Stores the CDN link of every uploaded file, ``uploads`` maps the file names of the message to attachment hashes."""
+    for attachment in message.attachments if message else []:
+        if (file_hash := uploads.get(attachment.filename)) is not None:
+            await Database.AttachmentDB.set_cdn_url(file_hash, attachment.url, cdn_url_expires_at(attachment.url))
+
+
+def mark_if_late(embed: discord.Embed, fire_at: int) -> None:
+    if Clock.timestamp() - fire_at > BACKLOG_LATE_THRESHOLD:
+        embed.add_field(name="", value=f"⏰ Sent late, this reminder was due <t:{fire_at}:R>", inline=False)
+
+
+def payload_fingerprint(reminder: Database.RemindersDB) -> tuple:
+    # Everything a message part is built from, a prepared part is only used while it still matches
+    return (reminder.name, reminder.description, reminder.link, reminder.mention_role, reminder.user_id, reminder.channel_id,
+            reminder.private, reminder.type, reminder.file_hash, reminder.file_name)
+
+
+class MessagePart(NamedTuple):
+    """What a single reminder contributes to a message that may carry several of them."""
+    embed: discord.Embed
+    mention: str
+    link: str | None
+    name: str
+    # Attachment to upload with the message, None if there is no file or its CDN link is reused
+    upload: Row | None
+    file_name: str | None
+    fire_at: int
 
 
 class Dispatcher:
-    bot: discord.Bot
+    # In the bot process this is the gateway bot, in worker.py a client that is only logged in to the REST API
+    bot: discord.Client
+    scheduler: Scheduler = Scheduler()
+    delivery: DeliveryPool = DeliveryPool(
+        workers=DELIVERY_WORKERS,
+        global_rate=DELIVERY_GLOBAL_RATE,
+        destination_rate=DELIVERY_DESTINATION_RATE,
+        destination_burst=DELIVERY_DESTINATION_BURST,
+        retry_after=rate_limit_retry_after,
+        max_retries=DELIVERY_MAX_RETRIES
+    )
+    file_budget: ByteBudget = ByteBudget(DELIVERY_INFLIGHT_BYTES)
+    # Resolved channels and users by destination key, and the error for ones that are missing or forbidden
+    recipients: TTLCache = TTLCache(RECIPIENT_CACHE_SIZE, RECIPIENT_CACHE_TTL)
+    # Paces reminders sent later than BACKLOG_LATE_THRESHOLD, so a backlog doesn't crowd out the ones on time
+    backlog: TokenBucket = TokenBucket(BACKLOG_DRAIN_RATE, BACKLOG_DRAIN_BURST)
+    # Set in the bot process when the dispatcher runs elsewhere, schedule changes are then sent through the database
+    publish_events: bool = False
+    # Message parts built ahead of time for reminders due within PRERENDER_WINDOW, by idempotency key
+    prepared: LRUCache = LRUCache(PRERENDER_CACHE_SIZE)
+    # Unix time of the last dispatch tick that completed, the health check fails when it falls behind
+    last_tick: float = Clock.timestamp()
+    _task: asyncio.Task | None = None
+
+    @classmethod
+    def start(cls):
+        # on_ready fires again after every reconnect, only one dispatch loop may run
+        if cls._task is None or cls._task.done():
+            cls._task = asyncio.create_task(cls.run())
+            cls._task.add_done_callback(cls._report_exit)
+
+    @staticmethod
+    def _report_exit(task: asyncio.Task) -> None:
+        # The task is never awaited in the bot process, without this its error would go unnoticed
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Dispatcher stopped, no reminders are sent until the next reconnect", exc_info=task.exception())
+
+    @classmethod
+    async def run(cls):
+        runner = None
+        if METRICS_PORT:
+            try:
+                runner = await Metrics.serve(METRICS_HOST, METRICS_PORT, cls.is_alive, debug={"queries": Database.profiler.snapshot})
+            except OSError as e:
+                # Reminders still go out without the endpoint, every dispatcher process on a host needs a port of its own
+                logger.error("Metrics endpoint not served, %s:%d can't be bound (set REMINDER_METRICS_PORT per process): %r",
+                             METRICS_HOST, METRICS_PORT, e)
+        try:
+            await asyncio.gather(cls.check_reminders(), cls.prepare_upcoming())
+        finally:
+            if runner is not None:
+                await runner.cleanup()
+
+    @classmethod
+    def is_alive(cls) -> bool:
+        return Clock.timestamp() - cls.last_tick < METRICS_STALL_AFTER
 
     @classmethod
     async def check_reminders(cls):
+        await cls.load_schedule()
         while True:
-            await cls.send_reminders()
-            await asyncio.sleep(DISPATCHER_PERIOD)
+            max_delay = DISPATCH_HEARTBEAT
+            try:
+                if (next_retry := await cls.send_reminders()) is not None:
+                    max_delay = min(max_delay, next_retry - Clock.timestamp())
+                cls.last_tick = Clock.timestamp()
+            except Exception:
+                logger.exception("Dispatch tick failed")
+            await cls.scheduler.wait(max_delay=max_delay)
 
     @classmethod
-    async def send_reminders(cls):
-        reminders = []
-        reminders.extend(await Database.RemindersDB.get_due_daily())
-        reminders.extend(await Database.RemindersDB.get_due_and_delete_date())
+    async def load_schedule(cls):
+        # Reminders missed while the bot was offline keep a past next_fire_at and fire on the first tick
+        cls.scheduler.clear()
+        for rem_id, next_fire_at in await Database.RemindersDB.get_schedule():
+            cls.scheduler.schedule(rem_id, next_fire_at)
 
-        if reminders:
-            for reminder in reminders:
-                await cls.send_reminder_message(reminder)
+    @classmethod
+    async def run_standalone(cls):
+        """Runs the dispatcher in a process of its own, following the schedule changes published by the bot process."""
+        # Taken before the schedule is loaded, so no change made in between is missed
+        last_event = await Database.ScheduleEventDB.get_last_id()
+        await asyncio.gather(cls.run(), cls.follow_schedule_events(last_event))
 
     @classmethod
-    async def send_reminder_message(cls, reminder: Database.RemindersDB):
+    async def prepare_upcoming(cls):
+        """
+        Builds the message parts of reminders due within the next PRERENDER_WINDOW seconds and resolves their recipients,
+        so that sending them at the due instant only takes the HTTP request.
+        """
+        while True:
+            try:
+                now = int(Clock.timestamp())
+                upcoming = await Database.RemindersDB.get_upcoming(after=now, until=now + PRERENDER_WINDOW)
+                attachments = await cls.load_attachments(upcoming)
+                for reminder in upcoming:
+                    key = Database.OutboxDB.idempotency_key_for(reminder.id, reminder.next_fire_at)
+                    fingerprint = payload_fingerprint(reminder)
+                    if (cached := cls.prepared.get(key)) is not None and cached[0] == fingerprint:
+                        continue
+                    part = cls.build_message_part(reminder, reminder.next_fire_at, attachments.get(reminder.file_hash))
+                    cls.prepared.put(key, (fingerprint, part))
+                    try:
+                        await cls.get_recipient(reminder)
+                    except Exception as e:
+                        if not is_permanent_failure(e):
+                            logger.warning("Failed to resolve the recipient of reminder %s ahead of time: %r", reminder.id, e)
+            except Exception:
+                logger.exception("Failed to prepare upcoming reminders")
+            await asyncio.sleep(PRERENDER_INTERVAL)
+
+    @classmethod
+    def take_message_part(cls, reminder: Database.RemindersDB, occurrence: Database.OutboxDB, attachment: Row | None) -> MessagePart:
+        """Returns the part prepared for this occurrence if the reminder hasn't changed since, otherwise builds it now."""
+        cached = cls.prepared.get(occurrence.idempotency_key)
+        if cached is None or cached[0] != payload_fingerprint(reminder):
+            return cls.build_message_part(reminder, occurrence.fire_at, attachment)
+
+        cls.prepared.invalidate(occurrence.idempotency_key)
+        part = cached[1]
+        mark_if_late(part.embed, occurrence.fire_at)
+        return part
+
+    @classmethod
+    async def follow_schedule_events(cls, last_event: int):
+        pruned_at = 0
+        while True:
+            try:
+                for event_id, rem_id, fire_at in await Database.ScheduleEventDB.get_after(last_event):
+                    if fire_at is None:
+                        cls.scheduler.unschedule(rem_id)
+                    else:
+                        cls.scheduler.schedule(rem_id, fire_at)
+                    last_event = event_id
+
+                now = int(Clock.timestamp())
+                if now - pruned_at >= SCHEDULE_EVENT_RETENTION:
+                    await Database.ScheduleEventDB.prune(before=now - SCHEDULE_EVENT_RETENTION)
+                    pruned_at = now
+            except Exception:
+                logger.exception("Failed to read schedule events")
+            await asyncio.sleep(SCHEDULE_EVENT_POLL)
+
+    @classmethod
+    async def schedule(cls, reminder_id: int, fire_at: int):
+        if cls.publish_events:
+            await Database.ScheduleEventDB.publish(reminder_id, fire_at)
+        else:
+            cls.scheduler.schedule(reminder_id, fire_at)
+
+    @classmethod
+    async def unschedule(cls, reminder_id: int):
+        if cls.publish_events:
+            await Database.ScheduleEventDB.publish(reminder_id, None)
+        else:
+            cls.scheduler.unschedule(reminder_id)
+
+    @classmethod
+    async def send_reminders(cls) -> int | None:
+        """
+        Moves due reminders to the outbox and sends the occurrences ready in it: all on-time ones and as many late
+        ones as the backlog rate allows. Returns when the dispatcher has to run again for retries or the backlog, if at all.
+        """
+        # The heap only decides when to wake up. Due reminders are claimed on every tick, heartbeats included,
+        # so reminders scheduled by other processes or left behind by a crashed worker are picked up as well
+        until = int(Clock.timestamp())
+        cls.scheduler.pop_due(until)
+
+        due = 0
+        while True:
+            reminders = await Database.RemindersDB.claim_due(until, DISPATCHER_WORKER_ID, lease_until=until + DISPATCHER_LEASE,
+                                                             limit=DISPATCHER_CLAIM_BATCH)
+            if reminders:
+                await cls.enqueue(reminders, until)
+            due += len(reminders)
+            if len(reminders) < DISPATCHER_CLAIM_BATCH:
+                break
+        TICK_DUE.observe(due)
+
+        late_since = until - BACKLOG_LATE_THRESHOLD
+        await cls.dispatch_ready(until, fired_after=late_since)
+        if BACKLOG_POLICY != "send":
+            # Too old to be sent one by one, dropped or summarized without waiting for the backlog rate
+            await cls.dispatch_ready(until, fired_before=until - BACKLOG_MAX_AGE)
+
+        budget = cls.backlog.available
+        drained = await cls.dispatch_ready(until, fired_before=late_since, limit=budget, latest_first=True) if budget else 0
+        cls.backlog.take(drained)
+
+        OUTBOX_DEPTH.set(await Database.OutboxDB.count())
+        next_run = await Database.OutboxDB.get_next_attempt_at(after=until)
+        if drained == budget:
+            # More of the backlog may be waiting for the bucket to refill
+            next_run = min(next_run or until + 1, until + 1)
+        return next_run
+
+    @classmethod
+    async def dispatch_ready(cls, until: int, limit: int | None = None, **claim_filter) -> int:
+        """Claims and dispatches ready outbox occurrences in batches, returns how many were claimed."""
+        claimed = 0
+        while limit is None or claimed < limit:
+            batch = DISPATCHER_CLAIM_BATCH if limit is None else min(DISPATCHER_CLAIM_BATCH, limit - claimed)
+            entries = await Database.OutboxDB.claim_ready(until, DISPATCHER_WORKER_ID, lease_until=until + DISPATCHER_LEASE,
+                                                          limit=batch, **claim_filter)
+            if entries:
+                await cls.dispatch(entries)
+            claimed += len(entries)
+            if len(entries) < batch:
+                break
+        return claimed
+
+    @classmethod
+    async def enqueue(cls, reminders: Sequence[Database.RemindersDB], until: int):
+        """Puts the occurrences of claimed reminders in the outbox. Daily reminders move on to their next fire time right away."""
+        next_fire_at = {
+            reminder.id: next_daily_fire_at(reminder.timestamp, reminder.timezone, after=until)
+            for reminder in reminders if reminder.type == "Daily"
+        }
+        async with Database.unit_of_work():
+            await Database.OutboxDB.enqueue([(reminder.id, reminder.next_fire_at) for reminder in reminders], now=until)
+            advanced = await Database.RemindersDB.set_next_fire_at(next_fire_at, DISPATCHER_WORKER_ID) if next_fire_at else []
+            await Database.RemindersDB.release_claims([reminder.id for reminder in reminders if reminder.type == "Date"], DISPATCHER_WORKER_ID)
+
+        for rem_id in advanced:
+            cls.scheduler.schedule(rem_id, next_fire_at[rem_id])
+
+    @classmethod
+    async def dispatch(cls, entries: Sequence[Database.OutboxDB]):
+        """
+        Sends claimed outbox occurrences. Sent ones leave the outbox together with their Date reminder,
+        failed ones are retried with exponential backoff until they run out of attempts.
+        """
+        reminders = await Database.RemindersDB.get_by_ids({entry.reminder_id for entry in entries})
+        # Occurrences of reminders deleted in the meantime are dropped
+        finished = [entry for entry in entries if entry.reminder_id not in reminders]
+        entries = [entry for entry in entries if entry.reminder_id in reminders]
+
+        now = int(Clock.timestamp())
+        stale = [entry for entry in entries if BACKLOG_POLICY != "send" and entry.fire_at < now - BACKLOG_MAX_AGE]
+        if stale:
+            entries = [entry for entry in entries if entry.fire_at >= now - BACKLOG_MAX_AGE]
+            if BACKLOG_POLICY == "drop":
+                logger.warning("Dropping %d reminders older than %d seconds", len(stale), BACKLOG_MAX_AGE)
+                finished.extend(stale)
+                stale = []
+
+        attachments = await cls.load_attachments([reminders[entry.reminder_id] for entry in entries])
+
+        renewal = asyncio.create_task(cls.renew_leases([entry.id for entry in entries + stale]))
+        try:
+            results = await cls.deliver(entries, reminders, attachments)
+            if stale:
+                results += await cls.deliver_summaries(stale, reminders)
+                entries += stale
+        finally:
+            renewal.cancel()
+
+        now = int(Clock.timestamp())
+        retries = {}
+        delivered, unreachable = [], []
+        for entry, result in zip(entries, results):
+            if not isinstance(result, Exception):
+                finished.append(entry)
+                delivered.append(entry.reminder_id)
+            elif is_permanent_failure(result):
+                logger.error("Giving up on reminder %s, its recipient is unavailable: %r", entry.reminder_id, result)
+                # A RecipientUnavailable with a cause came from the cache, which is not extended by it
+                if not (isinstance(result, RecipientUnavailable) and result.__cause__ is not None):
+                    cls.recipients.put(cls.destination_key(reminders[entry.reminder_id]), result, ttl=RECIPIENT_NEGATIVE_TTL)
+                finished.append(entry)
+                unreachable.append(entry.reminder_id)
+            elif entry.attempts + 1 >= DELIVERY_MAX_ATTEMPTS:
+                logger.error("Giving up on reminder %s after %d attempts", entry.reminder_id, entry.attempts + 1, exc_info=result)
+                finished.append(entry)
+            else:
+                logger.warning("Failed to send reminder %s, attempt %d: %r", entry.reminder_id, entry.attempts + 1, result)
+                retries[entry.id] = (now + round(backoff_delay(entry.attempts + 1, DELIVERY_BACKOFF_BASE, DELIVERY_BACKOFF_CAP)), repr(result))
+
+        async with Database.unit_of_work():
+            if finished:
+                await Database.OutboxDB.complete([entry.id for entry in finished])
+                released_files = await Database.RemindersDB.delete_fired({entry.reminder_id: entry.fire_at for entry in finished})
+                if released_files:
+                    await Database.AttachmentDB.free(released_files)
+            if retries:
+                await Database.OutboxDB.retry_later(retries)
+            if delivered:
+                await Database.RemindersDB.reset_failures(delivered)
+            disabled = await Database.RemindersDB.record_failures(unreachable, RECIPIENT_MAX_FAILURES, now) if unreachable else []
+
+        for rem_id in disabled:
+            logger.warning("Disabled reminder %s after %d failed deliveries", rem_id, RECIPIENT_MAX_FAILURES)
+            cls.scheduler.unschedule(rem_id)
+
+    @classmethod
+    async def load_attachments(cls, reminders: Sequence[Database.RemindersDB]) -> dict[str, Row]:
+        """
+        Returns the attachment metadata of ``reminders`` by hash. Stored CDN links of images that expire within
+        CDN_URL_REFRESH_MARGIN are signed again first, signed links only last about a day and would otherwise be
+        stale at every Daily fire.
+        """
+        file_hashes = {reminder.file_hash for reminder in reminders if reminder.file_hash}
+        attachments = await Database.AttachmentDB.get_metadata(file_hashes) if file_hashes else {}
+        images = {reminder.file_hash for reminder in reminders if reminder.file_hash and is_embed_image(reminder.file_name)}
+        expiring = {attachment.cdn_url: file_hash for file_hash, attachment in attachments.items()
+                    if file_hash in images and attachment.cdn_url and not cdn_url_is_fresh(attachment)}
+        if expiring and await cls.refresh_cdn_urls(expiring):
+            attachments = await Database.AttachmentDB.get_metadata(file_hashes)
+        return attachments
+
+    @classmethod
+    async def refresh_cdn_urls(cls, urls: dict[str, str]) -> int:
+        """
+        Has Discord sign expiring CDN links again, ``urls`` maps each link to its attachment hash. A link Discord
+        doesn't refresh (its message was deleted) is left as it is and the file gets uploaded again. Returns how many were refreshed.
+        """
+        links = list(urls)
+        refreshed = 0
+        for offset in range(0, len(links), CDN_URL_REFRESH_BATCH):
+            chunk = links[offset:offset + CDN_URL_REFRESH_BATCH]
+            try:
+                response = await cls.bot.http.request(discord.http.Route("POST", "/attachments/refresh-urls"), json={"attachment_urls": chunk})
+            except discord.HTTPException as e:
+                logger.warning("Failed to refresh %d CDN links: %r", len(chunk), e)
+                continue
+            for link in response.get("refreshed_urls", []):
+                if (file_hash := urls.get(link.get("original"))) is not None and link.get("refreshed"):
+                    await Database.AttachmentDB.set_cdn_url(file_hash, link["refreshed"], cdn_url_expires_at(link["refreshed"]))
+                    refreshed += 1
+        CDN_URLS_REFRESHED.inc(refreshed)
+        return refreshed
+
+    @staticmethod
+    async def renew_leases(entry_ids: list[int]):
+        # Keeps the claim alive while a large batch is still being sent, so no other worker takes it over
+        while True:
+            await asyncio.sleep(DISPATCHER_LEASE / 3)
+            lease_until = int(Clock.timestamp()) + DISPATCHER_LEASE
+            try:
+                await Database.OutboxDB.renew_leases(entry_ids, DISPATCHER_WORKER_ID, lease_until)
+            except Exception:
+                logger.exception("Failed to renew the lease of %d outbox entries", len(entry_ids))
+
+    @classmethod
+    async def deliver(cls, entries: Sequence[Database.OutboxDB], reminders: dict[int, Database.RemindersDB],
+                      attachments: dict[str, Row]) -> list:
+        """
+        Returns the sent message or the exception for every entry, in order.
+        Entries for the same destination are packed into as few messages as Discord's limits allow.
+        """
+        parts = {entry.id: cls.take_message_part(reminder := reminders[entry.reminder_id], entry, attachments.get(reminder.file_hash))
+                 for entry in entries}
+        batches = cls.coalesce(entries, reminders, parts)
+
+        results = await cls.delivery.run(
+            (cls.destination_key(reminder := reminders[batch[0].reminder_id]),
+             functools.partial(cls.send_batch, reminder, [parts[entry.id] for entry in batch], cls.batch_nonce(batch)))
+            for batch in batches
+        )
+        if saved := len(entries) - len(batches):
+            SENDS_SAVED.inc(saved)
+            logger.info("Sent %d reminders in %d messages, %d sends saved", len(entries), len(batches), saved)
+
+        outcome = {entry.id: result for batch, result in zip(batches, results) for entry in batch}
+        return [outcome[entry.id] for entry in entries]
+
+    @classmethod
+    def coalesce(cls, entries: Sequence[Database.OutboxDB], reminders: dict[int, Database.RemindersDB],
+                 parts: dict[int, MessagePart]) -> list[list[Database.OutboxDB]]:
+        """Groups entries by destination, in order, into batches that fit into one message."""
+        batches: list[list[Database.OutboxDB]] = []
+        open_batches: dict[tuple[str, int], dict] = {}
+        for entry in entries:
+            part = parts[entry.id]
+            key = cls.destination_key(reminders[entry.reminder_id])
+            chars = len(part.embed)
+            upload = part.upload.size if part.upload else 0
+
+            batch = open_batches.get(key)
+            if batch is None or len(batch["entries"]) >= MESSAGE_MAX_EMBEDS or batch["chars"] + chars > MESSAGE_MAX_EMBED_CHARS \
+                    or (part.upload and (len(batch["files"]) >= MESSAGE_MAX_FILES or part.file_name in batch["files"]
+                                         or batch["upload"] + upload > MESSAGE_MAX_UPLOAD)):
+                batch = open_batches[key] = {"entries": [], "chars": 0, "files": set(), "upload": 0}
+                batches.append(batch["entries"])
+
+            batch["entries"].append(entry)
+            batch["chars"] += chars
+            batch["upload"] += upload
+            if part.upload:
+                batch["files"].add(part.file_name)
+        return batches
+
+    @staticmethod
+    def batch_nonce(batch: Sequence[Database.OutboxDB]) -> str:
+        """
+        Derives the message nonce from the idempotency keys of every occurrence in the batch. A retry of the same batch
+        sends the same nonce in whatever order its entries come, a batch of other occurrences never shares it.
+        Discord accepts at most 25 characters.
+        """
+        keys = "\n".join(sorted(entry.idempotency_key for entry in batch))
+        return hashlib.sha256(keys.encode()).hexdigest()[:25]
+
+    @classmethod
+    async def deliver_summaries(cls, entries: Sequence[Database.OutboxDB], reminders: dict[int, Database.RemindersDB]) -> list:
+        """Sends one summary per destination instead of the reminders themselves, returns its outcome for every entry in order."""
+        groups: dict[tuple[str, int], list[Database.OutboxDB]] = {}
+        for entry in entries:
+            groups.setdefault(cls.destination_key(reminders[entry.reminder_id]), []).append(entry)
+
+        results = await cls.delivery.run(
+            (key, functools.partial(cls.send_summary_message, [reminders[entry.reminder_id] for entry in group], group))
+            for key, group in groups.items()
+        )
+        outcome = {entry.id: result for group, result in zip(groups.values(), results) for entry in group}
+        return [outcome[entry.id] for entry in entries]
+
+    @staticmethod
+    def destination_key(reminder: Database.RemindersDB) -> tuple[str, int]:
+        return ("user", reminder.user_id) if reminder.private else ("channel", reminder.channel_id)
+
+    @staticmethod
+    def build_message_part(reminder: Database.RemindersDB, fire_at: int, attachment: Row | None) -> MessagePart:
         embed = discord.Embed(
             title=f'Reminder: "{reminder.name}"',
             color=REMINDER_MESSAGE_COLOR,
@@ -40,26 +532,107 @@ class Dispatcher:
             icon_url=constants.CLOCK_ICON
         )
 
-        file = discord.File(io.BytesIO(reminder.file), filename=reminder.file_name) if reminder.file else None
-        if file and reminder.file_name.split(".")[-1].lower() in EMBED_IMAGE_TYPES:
-            embed.set_image(url=f"attachment://{reminder.file_name}")
+        upload = None
+        if reminder.file_hash and attachment is not None:
+            # Images uploaded before are shown through their CDN link, so nothing is uploaded again
+            if cdn_url_is_fresh(attachment) and is_embed_image(reminder.file_name):
+                embed.set_image(url=attachment.cdn_url)
+            else:
+                upload = attachment
+                if is_embed_image(reminder.file_name):
+                    embed.set_image(url=f"attachment://{reminder.file_name}")
 
-        if reminder.private:
-            recipient = await cls.bot.get_or_fetch_user(reminder.user_id)
-        else:
-            recipient = cls.bot.get_channel(reminder.channel_id)
-            if recipient is None:
-                recipient = await cls.bot.fetch_channel(reminder.channel_id)
+        embed.timestamp = calculate_timestamp_for_discord_footer(fire_at)
+        mark_if_late(embed, fire_at)
+
+        mention = f"<@{reminder.user_id}>" if not reminder.mention_role else f"<@&{reminder.mention_role}>"
+        return MessagePart(embed=embed, mention=mention, link=reminder.link, name=reminder.name, upload=upload, file_name=reminder.file_name,
+                           fire_at=fire_at)
+
+    @classmethod
+    async def send_batch(cls, reminder: Database.RemindersDB, parts: list[MessagePart], nonce: str):
+        """Sends the parts as one message to the destination of ``reminder``."""
+        try:
+            recipient = await cls.get_recipient(reminder)
 
-        if reminder.link:
-            view = discord.ui.View()
-            view.add_item(discord.ui.Button(style=discord.ButtonStyle.url, url=reminder.link, label="Link", emoji="🔗"))
-        else:
             view = None
+            links = [part for part in parts if part.link]
+            if links:
+                view = discord.ui.View()
+                for part in links:
+                    label = "Link" if len(links) == 1 else part.name[:80]
+                    view.add_item(discord.ui.Button(style=discord.ButtonStyle.url, url=part.link, label=label, emoji="🔗"))
 
-        embed.timestamp = calculate_timestamp_for_discord_footer(reminder.timestamp, reminder_type=reminder.type)
+            content = " ".join(dict.fromkeys(part.mention for part in parts)) if not isinstance(recipient, discord.DMChannel) else None
+            uploads = [part for part in parts if part.upload]
 
-        mention = f"<@{reminder.user_id}>" if not reminder.mention_role else f"<@&{reminder.mention_role}>"
-        content = mention if not isinstance(recipient, discord.DMChannel) else None
+            # Attachments are read just before their send and count against the in-flight byte budget until it finishes
+            async with cls.file_budget.reserve(sum(part.upload.size for part in uploads)):
+                files = []
+                for part in uploads:
+                    if (file_data := await Database.AttachmentDB.get_data(part.upload.hash)) is not None:
+                        files.append(discord.File(io.BytesIO(file_data), filename=part.file_name))
+
+                # Discord drops a message whose nonce it has seen shortly before, so a retry after a lost response doesn't post twice
+                started = time.perf_counter()
+                message = await asyncio.wait_for(
+                    recipient.send(content=content, embeds=[part.embed for part in parts], files=files or None, view=view,
+                                   nonce=nonce, enforce_nonce=True),
+                    timeout=DELIVERY_SEND_TIMEOUT
+                )
+                SEND_LATENCY.observe(time.perf_counter() - started)
+
+            sent_at = Clock.timestamp()
+            for part in parts:
+                FIRE_LATENESS.observe(max(0.0, sent_at - part.fire_at))
+            REMINDERS_SENT.inc(len(parts))
+        except Exception as e:
+            SEND_ERRORS.inc(type=type(e).__name__, status=str(getattr(e, "status", "")))
+            raise
+
+        await remember_cdn_urls({part.file_name: part.upload.hash for part in uploads}, message)
+        return message
+
+    @classmethod
+    async def send_summary_message(cls, reminders: list[Database.RemindersDB], occurrences: list[Database.OutboxDB]):
+        lines = [f'• "{reminder.name}", due <t:{occurrence.fire_at}:f>' for reminder, occurrence in zip(reminders, occurrences)]
+        if len(lines) > BACKLOG_SUMMARY_LINES:
+            lines = lines[:BACKLOG_SUMMARY_LINES] + [f"…and {len(lines) - BACKLOG_SUMMARY_LINES} more"]
+
+        embed = discord.Embed(
+            title=f"{len(reminders)} reminders were missed",
+            color=REMINDER_MESSAGE_COLOR,
+            description="These reminders couldn't be sent on time:\n" + "\n".join(lines)
+        ).set_footer(text="Missed reminders", icon_url=constants.CLOCK_ICON)
+
+        recipient = await cls.get_recipient(reminders[0])
+        mentions = dict.fromkeys(f"<@{reminder.user_id}>" if not reminder.mention_role else f"<@&{reminder.mention_role}>" for reminder in reminders)
+        content = " ".join(mentions) if not isinstance(recipient, discord.DMChannel) else None
+
+        return await asyncio.wait_for(
+            recipient.send(content=content, embed=embed, nonce=f"summary:{min(occurrence.id for occurrence in occurrences)}", enforce_nonce=True),
+            timeout=DELIVERY_SEND_TIMEOUT
+        )
+
+    @classmethod
+    async def get_recipient(cls, reminder: Database.RemindersDB) -> discord.abc.Messageable:
+        key = cls.destination_key(reminder)
+        recipient = cls.recipients.get(key)
+        if isinstance(recipient, Exception):
+            raise RecipientUnavailable(key) from recipient
+        if recipient is not None:
+            return recipient
+
+        try:
+            if reminder.private:
+                recipient = await cls.bot.get_or_fetch_user(reminder.user_id)
+            else:
+                recipient = cls.bot.get_channel(reminder.channel_id) or await cls.bot.fetch_channel(reminder.channel_id)
+            if recipient is None:
+                raise RecipientUnavailable(key)
+        except (discord.NotFound, discord.Forbidden, RecipientUnavailable) as e:
+            cls.recipients.put(key, e, ttl=RECIPIENT_NEGATIVE_TTL)
+            raise
 
-        return await recipient.send(content=content, embed=embed, file=file, view=view)
+        cls.recipients.put(key, recipient)
+        return recipient
@@ -0,0 +1,137 @@
+import bisect
+from typing import Any, Callable
+
+from aiohttp import web
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels) + "}" if labels else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: dict[tuple[tuple[str, str], ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}" for labels, value in self._values.items()]
+
+
+class Gauge:
+    """A value that is either set explicitly or, with ``function``, read when the metrics are collected."""
+    type = "gauge"
+
+    def __init__(self, name: str, description: str, function: Callable[[], float] | None = None):
+        self.name = name
+        self.description = description
+        self.function = function
+        self._value: float | None = None
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def value(self) -> float | None:
+        return self.function() if self.function is not None else self._value
+
+    def samples(self) -> list[str]:
+        value = self.value()
+        return [] if value is None else [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: list[float]):
+        self.name = name
+        self.description = description
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    def samples(self) -> list[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + [float("inf")], self._counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _format_value(bound)
+            lines.append(f'{self.name}_bucket{{le="{le}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {_format_value(self._sum)}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Gauge | Histogram] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+async def serve(host: str, port: int, is_alive: Callable[[], bool], debug: dict[str, Callable[[], Any]] | None = None) -> web.AppRunner:
+    """
+    Serves ``/metrics`` in the Prometheus text format and ``/healthz``, which answers 503 once ``is_alive`` returns False.
+    Every entry of ``debug`` is served as JSON under ``/debug/<name>``.
+    Returns the runner, ``await runner.cleanup()`` stops the server. Raises OSError when the port can't be bound.
+    """
+    async def metrics(_request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def health(_request: web.Request) -> web.Response:
+        return web.Response(text="ok\n") if is_alive() else web.Response(status=503, text="dispatch loop stalled\n")
+
+    def debug_route(provider: Callable[[], Any]):
+        async def handler(_request: web.Request) -> web.Response:
+            return web.json_response(provider())
+        return handler
+
+    app = web.Application()
+    app.add_routes([web.get("/metrics", metrics), web.get("/healthz", health)])
+    app.add_routes([web.get(f"/debug/{name}", debug_route(provider)) for name, provider in (debug or {}).items()])
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except BaseException:
+        await runner.cleanup()
+        raise
+    return runner
@@ -1,3 +1,4 @@
+import asyncio
 import io
 from typing import Literal
 
@@ -7,9 +8,11 @@ from discord.ui import Modal, InputText, View, Select
 from pendulum import Timezone
 
 import Database
+import Tracing
+from Dispatcher import Dispatcher
 from ReminderTime import ReminderTime, TimeInPastException, ExcessiveFutureTimeException, InvalidReminderTypeException, InvalidTimeFormatException
-from common import can_user_tag_role
-from constants import FILE_ICON, EMBED_IMAGE_TYPES, ERROR_MESSAGE_COLOR, UTC_ZONES, INFO_MESSAGE_COLOR, SUCCESS_MESSAGE_COLOR
+from common import can_user_tag_role, is_embed_image, make_thumbnail, format_file_size
+from constants import FILE_ICON, THUMBNAIL_FILE_NAME, ERROR_MESSAGE_COLOR, UTC_ZONES, INFO_MESSAGE_COLOR, SUCCESS_MESSAGE_COLOR
 
 
 class EditErrorEmbed(Embed):
@@ -20,8 +23,14 @@ class EditErrorEmbed(Embed):
         self.description = message
 
 
+def message_has_preview(interaction: discord.Interaction) -> bool:
+    # The edit page message carries the image preview as its only attachment
+    return bool(interaction.message and interaction.message.attachments)
+
+
 class ReminderEditEmbed(Embed):
-    def __init__(self, reminder: Database.RemindersDB, embed_type: Literal["short", "full"], roles: list[discord.Role], **kwargs):
+    def __init__(self, reminder: Database.RemindersDB, embed_type: Literal["short", "full"], roles: list[discord.Role],
+                 has_preview: bool = False, **kwargs):
         super().__init__(**kwargs)
         self._reminder_id = reminder.id
         self.title = f"Reminder: {reminder.name}"
@@ -38,7 +47,7 @@ class ReminderEditEmbed(Embed):
 
         self.add_field(name="🔖 Type", value=f"`{reminder.type}`")
         self.add_field(name="🔒 Privacy", value='`Private`' if reminder.private else '`Public`')
-        date = f"<t:{reminder.timestamp}:f>" if reminder.type == "Date" else f"<t:{reminder.timestamp}:t>"
+        date = f"<t:{reminder.next_fire_at}:f>" if reminder.type == "Date" else f"<t:{reminder.next_fire_at}:t>"
         self.add_field(name=f"📅 Date" if reminder.type == "Date" else f"🕓 Time", value=date)
 
         if reminder.mention_role:
@@ -53,6 +62,10 @@ class ReminderEditEmbed(Embed):
 
         self.add_field(name="📋 Channel", value=f"<#{reminder.channel_id}>")
 
+        if reminder.disabled_at is not None:
+            self.add_field(name="⛔ Disabled", value="The channel or user couldn't be reached. Edit the time to turn the reminder back on.",
+                           inline=False)
+
 
         if reminder.link:
             link = reminder.link if len(reminder.link) < 30 else reminder.link.split("https://", maxsplit=1)[-1][:27] + "..."
@@ -61,9 +74,11 @@ class ReminderEditEmbed(Embed):
         if reminder.file_name is not None:
             if embed_type == "short":
                 self.set_footer(text=f"File: {reminder.file_name}", icon_url=FILE_ICON)
+            elif has_preview:
+                self.set_image(url=f"attachment://{THUMBNAIL_FILE_NAME}")
             else:
-                if reminder.file_name.split(".")[-1].lower() in EMBED_IMAGE_TYPES:
-                    self.set_image(url=f"attachment://{reminder.file_name}")
+                size = f" ({format_file_size(reminder.file_size)})" if reminder.file_size is not None else ""
+                self.add_field(name="📎 File", value=f"`{reminder.file_name}`{size}")
 
     @property
     def reminder_id(self):
@@ -76,13 +91,14 @@ class EditNameModal(Modal):
         self.add_item(InputText(label="New Name", placeholder="Enter new reminder name", max_length=100, min_length=3))
         self.reminder = reminder
 
+    @Tracing.interaction("edit name modal")
     async def callback(self, interaction: discord.Interaction):
         if self.children[0].value == self.reminder.name:
             return await interaction.response.send_message(embed=EditErrorEmbed(message="The new name is the same as the previous one"), ephemeral=True)
 
-        self.reminder.name = self.children[0].value
-        await self.reminder.save()
-        new_embed = ReminderEditEmbed(reminder=self.reminder, embed_type="full", roles=interaction.guild.roles if interaction.guild else None)
+        await self.reminder.save(name=self.children[0].value)
+        new_embed = ReminderEditEmbed(reminder=self.reminder, embed_type="full", roles=interaction.guild.roles if interaction.guild else None,
+                                      has_preview=message_has_preview(interaction))
 
         return await interaction.response.edit_message(embed=new_embed)
 
@@ -91,6 +107,7 @@ class EditMentionRoleSelect(Select):
         super().__init__(select_type=discord.ComponentType.role_select)
         self.reminder = reminder
 
+    @Tracing.interaction("edit mention role select")
     async def callback(self, interaction: discord.Interaction):
 
         selected_role: discord.Role | None = self.values[0] if self.values else None
@@ -104,10 +121,10 @@ class EditMentionRoleSelect(Select):
         if not can_user_tag_role(selected_role.mentionable, interaction.user.guild_permissions):
             return await interaction.response.send_message(embed=EditErrorEmbed(message="The new name is the same as the previous one"), ephemeral=True)
 
-        self.reminder.mention_role = selected_role.id
-        await self.reminder.save()
+        await self.reminder.save(mention_role=selected_role.id)
 
-        new_embed = ReminderEditEmbed(reminder=self.reminder, embed_type="full", roles=interaction.guild.roles if interaction.guild else None)
+        new_embed = ReminderEditEmbed(reminder=self.reminder, embed_type="full", roles=interaction.guild.roles if interaction.guild else None,
+                                      has_preview=message_has_preview(interaction))
         return await interaction.response.edit_message(embed=new_embed)
 
 class EditDescriptionModal(Modal):
@@ -116,13 +133,14 @@ class EditDescriptionModal(Modal):
         self.add_item(InputText(label="New description", placeholder="Enter new reminder description", max_length=1000, style=discord.InputTextStyle.multiline, required=False))
         self.reminder = reminder
 
+    @Tracing.interaction("edit description modal")
     async def callback(self, interaction: discord.Interaction):
         if self.children[0].value == self.reminder.description:
             return await interaction.response.send_message(embed=EditErrorEmbed(message="The new description is the same as the previous one"), ephemeral=True)
 
-        self.reminder.description = self.children[0].value
-        await self.reminder.save()
-        new_embed = ReminderEditEmbed(reminder=self.reminder, embed_type="full", roles=interaction.guild.roles if interaction.guild else None)
+        await self.reminder.save(description=self.children[0].value)
+        new_embed = ReminderEditEmbed(reminder=self.reminder, embed_type="full", roles=interaction.guild.roles if interaction.guild else None,
+                                      has_preview=message_has_preview(interaction))
 
         return await interaction.response.edit_message(embed=new_embed)
 
@@ -133,15 +151,16 @@ class EditLinkModal(Modal):
         self.add_item(InputText(label="New link", placeholder="Enter new reminder link", max_length=1000, style=discord.InputTextStyle.multiline, required=False))
         self.reminder = reminder
 
+    @Tracing.interaction("edit link modal")
     async def callback(self, interaction: discord.Interaction):
         if self.children[0].value == self.reminder.description:
             return await interaction.response.send_message(embed=EditErrorEmbed(message="The new link is the same as the previous one"), ephemeral=True)
         if self.children[0].value and not self.children[0].value.startswith("https://"):
             return await interaction.response.send_message(embed=EditErrorEmbed(message="The link should start with \"https://\""), ephemeral=True)
 
-        self.reminder.link = self.children[0].value
-        await self.reminder.save()
-        new_embed = ReminderEditEmbed(reminder=self.reminder, embed_type="full", roles=interaction.guild.roles if interaction.guild else None)
+        await self.reminder.save(link=self.children[0].value)
+        new_embed = ReminderEditEmbed(reminder=self.reminder, embed_type="full", roles=interaction.guild.roles if interaction.guild else None,
+                                      has_preview=message_has_preview(interaction))
 
         return await interaction.response.edit_message(embed=new_embed)
 
@@ -154,6 +173,7 @@ class EditTimeModal(Modal):
         self.add_item(InputText(label="New type: Daily/Date", placeholder=f"Current type: {self.reminder.type}",
                                 max_length=5, min_length=4, value=self.reminder.type, required=False))
 
+    @Tracing.interaction("edit time modal")
     async def callback(self, interaction: discord.Interaction):
         if self.children[1].value is None:
             new_type = self.reminder.type
@@ -162,9 +182,10 @@ class EditTimeModal(Modal):
                 embed=EditErrorEmbed(message=f"Reminder type: {temp_new_type} is incorrect, possible types: \"Daily\", \"Date\""), ephemeral=True)
         else:
             new_type = temp_new_type
-        tz = await Database.UserDB.get_user_timezone(self.reminder.user_id)
+        tz_name = await Database.UserDB.get_user_timezone(self.reminder.user_id)
         try:
-            time = ReminderTime(self.children[0].value, rem_type=new_type, timezone=Timezone(UTC_ZONES[tz.tz_name]), minimal_minutes_from_now=10)
+            with Tracing.span("ReminderTime"):
+                time = ReminderTime(self.children[0].value, rem_type=new_type, timezone=Timezone(UTC_ZONES[tz_name]), minimal_minutes_from_now=10)
 
         except TimeInPastException:
             return await interaction.response.send_message(embed=EditErrorEmbed("The specified time is in the past, or too close to the present."), ephemeral=True)
@@ -178,13 +199,15 @@ class EditTimeModal(Modal):
         except InvalidTimeFormatException:
             return await interaction.response.send_message(embed=EditErrorEmbed("The specified time format cannot be parsed"), ephemeral=True)
 
-        if self.reminder.timestamp == time.bd_timestamp:
+        if self.reminder.type == new_type and self.reminder.next_fire_at == time.fire_at:
             return await interaction.response.send_message(embed=EditErrorEmbed(message="The new time is the same as the previous one"), ephemeral=True)
 
-        self.reminder.timestamp = time.bd_timestamp
-        self.reminder.type = new_type
-        await self.reminder.save()
-        new_embed = ReminderEditEmbed(reminder=self.reminder, embed_type="full", roles=interaction.guild.roles if interaction.guild else None)
+        # A dispatcher still sending the old time must not delete or advance the edited reminder afterwards
+        await self.reminder.save(timestamp=time.bd_timestamp, next_fire_at=time.fire_at, timezone=time.timezone.name, type=new_type,
+                                 claimed_by=None, lease_until=None, failure_count=0, disabled_at=None)
+        await Dispatcher.schedule(self.reminder.id, time.fire_at)
+        new_embed = ReminderEditEmbed(reminder=self.reminder, embed_type="full", roles=interaction.guild.roles if interaction.guild else None,
+                                      has_preview=message_has_preview(interaction))
 
         return await interaction.response.edit_message(content="### Choose Field to Edit", embed=new_embed)
 
@@ -215,26 +238,31 @@ class ReminderEditView(View):
 
     # noinspection PyUnusedLocal
     @discord.ui.button(label="Edit Name", style=discord.ButtonStyle.primary, emoji="✏️", row=0)
+    @Tracing.interaction("edit name button")
     async def edit_name_button(self, button: discord.ui.Button, interaction: discord.Interaction):
         await interaction.response.send_modal(modal=EditNameModal(reminder=self.reminder))
 
     # noinspection PyUnusedLocal
     @discord.ui.button(label="Edit Description", style=discord.ButtonStyle.primary, emoji="📝", row=0)
+    @Tracing.interaction("edit desc button")
     async def edit_desc_button(self, button: discord.ui.Button, interaction: discord.Interaction):
         await interaction.response.send_modal(modal=EditDescriptionModal(reminder=self.reminder))
 
     # noinspection PyUnusedLocal
     @discord.ui.button(label="Edit Link", style=discord.ButtonStyle.primary, emoji="🔗", row=0)
+    @Tracing.interaction("edit link button")
     async def edit_link_button(self, button: discord.ui.Button, interaction: discord.Interaction):
         await interaction.response.send_modal(modal=EditLinkModal(reminder=self.reminder))
 
     # noinspection PyUnusedLocal
     @discord.ui.button(label="Edit Time", style=discord.ButtonStyle.green, emoji="📅", row=1)
+    @Tracing.interaction("edit time button")
     async def edit_time_button(self, button: discord.ui.Button, interaction: discord.Interaction):
         await interaction.response.send_modal(modal=EditTimeModal(reminder=self.reminder))
 
     # noinspection PyUnusedLocal
     @discord.ui.button(label="Remove File", style=discord.ButtonStyle.danger, emoji="🔥", row=1)
+    @Tracing.interaction("remove file button")
     async def remove_file_button(self, button: discord.ui.Button, interaction: discord.Interaction):
         await self.reminder.remove_file()
 
@@ -244,13 +272,16 @@ class ReminderEditView(View):
 
     # noinspection PyUnusedLocal
     @discord.ui.button(label="Delete", style=discord.ButtonStyle.danger, emoji="🗑️", row=1)
+    @Tracing.interaction("delete button")
     async def delete_button(self, button: discord.ui.Button, interaction: discord.Interaction):
         embed = Embed(title="Success", description=f"Reminder \"{self.reminder.name}\" has been deleted.", color=SUCCESS_MESSAGE_COLOR)
         await self.reminder.delete()
+        await Dispatcher.unschedule(self.reminder.id)
         await interaction.response.edit_message(embed=embed, view=None)
 
     # noinspection PyUnusedLocal
     @discord.ui.button(label="Edit Mention Role", style=discord.ButtonStyle.primary, emoji="🔰", row=2)
+    @Tracing.interaction("edit mention role button")
     async def edit_mention_role_button(self, button: discord.ui.Button, interaction: discord.Interaction):
         self.remove_item(self.get_remove_mention_button())
         self.add_item(EditMentionRoleSelect(reminder=self.reminder))
@@ -279,7 +310,7 @@ class ReminderListView(View):
                 actual_index = start_idx + index
                 await self.show_reminder_details(interaction, self.embeds[actual_index].reminder_id)
 
-            button.callback = callback
+            button.callback = Tracing.interaction("reminder list select")(callback)
             self.add_item(button)
             self.embed_buttons.append(button)
 
@@ -291,13 +322,29 @@ class ReminderListView(View):
 
         reminder = await Database.RemindersDB.get_reminder_by_id(reminder_id)
         view = ReminderEditView(reminder, interaction.guild.roles if interaction.guild else None)
-        embed = ReminderEditEmbed(reminder=reminder, embed_type="full", roles=interaction.guild.roles if interaction.guild else None)
+        preview = await ReminderListView.get_preview(reminder) if reminder.file_hash else None
+        embed = ReminderEditEmbed(reminder=reminder, embed_type="full", roles=interaction.guild.roles if interaction.guild else None,
+                                  has_preview=preview is not None)
 
-        if reminder.file_name:
-            file = discord.File(io.BytesIO(reminder.file), filename=reminder.file_name)
+        if preview:
+            file = discord.File(io.BytesIO(preview), filename=THUMBNAIL_FILE_NAME)
             await interaction.followup.edit_message(message_id=interaction.message.id, content="### Choose Field to Edit", embed=embed, view=view, file=file)
         else:
-            await interaction.followup.edit_message(message_id=interaction.message.id, content="### Choose Field to Edit", embed=embed, view=view)
+            # Drop a preview left over from a previously opened reminder
+            await interaction.followup.edit_message(message_id=interaction.message.id, content="### Choose Field to Edit", embed=embed, view=view,
+                                                    attachments=[])
+
+    @staticmethod
+    async def get_preview(reminder: Database.RemindersDB) -> bytes | None:
+        if not is_embed_image(reminder.file_name):
+            return None
+        thumbnail = await Database.AttachmentDB.get_thumbnail(reminder.file_hash)
+        if thumbnail is None:
+            # Attachments stored before previews existed get theirs on first view
+            thumbnail = await asyncio.to_thread(make_thumbnail, await Database.AttachmentDB.get_data(reminder.file_hash))
+            if thumbnail is not None:
+                await Database.AttachmentDB.set_thumbnail(reminder.file_hash, thumbnail)
+        return thumbnail
 
     def update_buttons(self):
         self.first_page.disabled = self.page == 0
@@ -326,12 +373,14 @@ class ReminderListView(View):
 
     # noinspection PyUnusedLocal
     @discord.ui.button(label="<<", style=discord.ButtonStyle.blurple)
+    @Tracing.interaction("first page")
     async def first_page(self, button: discord.ui.Button, interaction: discord.Interaction):
         self.page = 0
         await self.update_message(interaction)
 
     # noinspection PyUnusedLocal
     @discord.ui.button(label="<", style=discord.ButtonStyle.danger)
+    @Tracing.interaction("prev page")
     async def prev_page(self, button: discord.ui.Button, interaction: discord.Interaction):
         self.page = max(0, self.page - 1)
         await self.update_message(interaction)
@@ -343,12 +392,14 @@ class ReminderListView(View):
 
     # noinspection PyUnusedLocal
     @discord.ui.button(label=">", style=discord.ButtonStyle.green)
+    @Tracing.interaction("next page")
     async def next_page(self, button: discord.ui.Button, interaction: discord.Interaction):
         self.page = min(self.total_pages - 1, self.page + 1)
         await self.update_message(interaction)
 
     # noinspection PyUnusedLocal
     @discord.ui.button(label=">>", style=discord.ButtonStyle.blurple)
+    @Tracing.interaction("last page")
     async def last_page(self, button: discord.ui.Button, interaction: discord.Interaction):
         self.page = self.total_pages - 1
         await self.update_message(interaction)
@@ -1,7 +1,8 @@
 import re
 
-from pendulum import Timezone, DateTime, now
+from pendulum import Timezone, DateTime
 
+import Clock
 from constants import HH_MM_pattern, FULL_DATE_pattern, TIMER_TIME_patterns
 
 
@@ -42,6 +43,7 @@ class ReminderTime:
 
     def __init__(self, unformatted_time: str, timezone: Timezone, rem_type: str, minimal_minutes_from_now: int = 1):
         self._reminder_type = rem_type
+        self._timezone = timezone
         self._minimal_minutes_from_now = minimal_minutes_from_now
         time = self._parse_time(unformatted_time, timezone)
         self._time = time
@@ -64,7 +66,7 @@ class ReminderTime:
     @staticmethod
     def _parse_hh_mm_pattern(time_str: str, timezone: Timezone) -> DateTime:
         hours, minutes = map(int, time_str.split(':'))
-        now_utc = now("UTC")
+        now_utc = Clock.now("UTC")
         this_day = now_utc.in_tz(timezone).set(hour=hours, minute=minutes, second=0, microsecond=0).in_tz("UTC")
 
         if this_day >= now_utc.add(minutes=1):
@@ -75,7 +77,7 @@ class ReminderTime:
         day, month, year, hours, minutes = time_match.groups()
 
         if not year:
-            year = str(now(tz=timezone).year)
+            year = str(Clock.now(timezone).year)
 
         day, month, year, hours, minutes = map(int, [day, month, year, hours, minutes])
 
@@ -109,7 +111,7 @@ class ReminderTime:
 
         days = weeks * 7 + days
         try:
-            time = now('UTC').in_tz(timezone).add(days=days, hours=hours, minutes=minutes, seconds=seconds).in_tz("UTC")
+            time = Clock.now('UTC').in_tz(timezone).add(days=days, hours=hours, minutes=minutes, seconds=seconds).in_tz("UTC")
         except OverflowError:
             raise ExcessiveFutureTimeException()
 
@@ -118,7 +120,7 @@ class ReminderTime:
         return time
 
     def _validate(self, time: DateTime) -> None:
-        now_utc = now("UTC")
+        now_utc = Clock.now("UTC")
         if time > now_utc.add(years=2):
             raise ExcessiveFutureTimeException()
 
@@ -129,13 +131,23 @@ class ReminderTime:
     def time(self) -> DateTime:
         return self._time
 
+    @property
+    def timezone(self) -> Timezone:
+        return self._timezone
+
+    @property
+    def fire_at(self) -> int:
+        return int(self._time.timestamp())
+
     @property
     def bd_timestamp(self) -> int:
         if self._reminder_type == 'Date':
             return int(self._time.timestamp())
 
         else:
-            return self._time.hour * 3600 + self._time.minute * 60 + self._time.second
+            # Daily reminders keep the wall-clock time of the user's zone, so they do not shift with DST
+            local_time = self._time.in_tz(self._timezone)
+            return local_time.hour * 3600 + local_time.minute * 60 + local_time.second
 
     def __repr__(self):
         return f"{self.__class__.__name__}({self.time} UTC)"
@@ -0,0 +1,77 @@
+import asyncio
+import heapq
+
+import Clock
+
+
+class Scheduler:
+    """
+    In-memory min-heap of reminder fire times.
+
+    Every reminder has at most one live entry; rescheduling or unscheduling only updates ``_entries``
+    and stale heap items are dropped lazily when they reach the top.
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[int, int]] = []
+        self._entries: dict[int, int] = {}
+        self._changed = asyncio.Event()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def schedule(self, reminder_id: int, fire_at: int) -> None:
+        fire_at = int(fire_at)
+        self._entries[reminder_id] = fire_at
+        heapq.heappush(self._heap, (fire_at, reminder_id))
+        self._changed.set()
+
+    def unschedule(self, reminder_id: int) -> None:
+        if self._entries.pop(reminder_id, None) is not None:
+            self._changed.set()
+
+    def clear(self) -> None:
+        self._heap.clear()
+        self._entries.clear()
+        self._changed.set()
+
+    def _prune(self) -> None:
+        while self._heap and self._entries.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    @property
+    def next_fire_at(self) -> int | None:
+        self._prune()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: int) -> list[tuple[int, int]]:
+        """Removes and returns ``(reminder_id, fire_at)`` for every entry with ``fire_at <= now``."""
+        due = []
+        while (fire_at := self.next_fire_at) is not None and fire_at <= now:
+            _, reminder_id = heapq.heappop(self._heap)
+            del self._entries[reminder_id]
+            due.append((reminder_id, fire_at))
+        return due
+
+    async def wait(self, max_delay: float | None = None) -> None:
+        """
+        Sleeps until the earliest entry is due, but no longer than ``max_delay`` seconds.
+        Wakes up early to re-check whenever the schedule changes.
+        """
+        deadline = None if max_delay is None else Clock.timestamp() + max_delay
+        while True:
+            self._changed.clear()
+            wake_at = self.next_fire_at
+            if deadline is not None:
+                wake_at = deadline if wake_at is None else min(wake_at, deadline)
+
+            if wake_at is None:
+                timeout = None
+            else:
+                timeout = wake_at - Clock.timestamp()
+                if timeout <= 0:
+                    return
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return
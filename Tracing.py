@@ -0,0 +1,203 @@
+import asyncio
+import functools
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+import discord
+
+from constants import TRACE_SAMPLE_RATE, TRACE_FILE, TRACE_COLLECTOR_URL, TRACE_FLUSH_INTERVAL, TRACE_DEADLINE_WARNING
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, attributes: dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration: float | None = None
+        self.error: str | None = None
+        self._started = time.perf_counter()
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self._started
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"name": self.name, "span_id": self.span_id, "parent_id": self.parent_id, "start": self.start, "duration": self.duration,
+                "error": self.error, "attributes": self.attributes}
+
+
+class Trace:
+    """The spans of one sampled interaction, ``open`` holds the ones still running."""
+
+    def __init__(self):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.spans: list[Span] = []
+        self.open: list[Span] = []
+
+    def to_dict(self) -> dict[str, Any]:
+        root = self.spans[-1]
+        return {"trace_id": self.trace_id, "name": root.name, "start": root.start, "duration": root.duration,
+                "spans": [span.to_dict() for span in sorted(self.spans, key=lambda span: span.start)]}
+
+
+_trace: ContextVar[Trace | None] = ContextVar("trace", default=None)
+_span: ContextVar[Span | None] = ContextVar("span", default=None)
+
+
+@contextmanager
+def span(name: str, **attributes: Any):
+    """Records the block as a child of the current span. Outside a sampled interaction it does nothing."""
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _span.get()
+    current = Span(name, trace.trace_id, parent.span_id if parent else None, attributes)
+    trace.open.append(current)
+    token = _span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = repr(e)
+        raise
+    finally:
+        current.finish()
+        _span.reset(token)
+        trace.open.remove(current)
+        trace.spans.append(current)
+
+
+def wrap(name: str, function: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Returns ``function`` recording every call as a span named ``name`` while an interaction is traced."""
+    @functools.wraps(function)
+    async def traced(*args, **kwargs):
+        if _trace.get() is None:
+            return await function(*args, **kwargs)
+        with span(name):
+            return await function(*args, **kwargs)
+
+    return traced
+
+
+def _find_interaction(args: tuple) -> discord.Interaction | None:
+    for arg in args:
+        if isinstance(arg, discord.ApplicationContext):
+            return arg.interaction
+        if isinstance(arg, discord.Interaction):
+            return arg
+    return None
+
+
+def _warn_deadline(name: str, interaction: discord.Interaction, trace: Trace | None, created: float) -> None:
+    if interaction.response.is_done():
+        return
+    where = " > ".join(span_.name for span_ in trace.open) if trace is not None else "not sampled"
+    logger.warning("%s hasn't responded %.1fs after the interaction was created, Discord allows 3 seconds (in: %s)",
+                   name, time.time() - created, where)
+
+
+def interaction(name: str):
+    """
+    Traces a slash command or component callback. The handler becomes the root span when the interaction is sampled,
+    and whether sampled or not a warning is logged when it hasn't responded TRACE_DEADLINE_WARNING seconds after the
+    interaction was created.
+    """
+    def decorator(handler: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(handler)
+        async def traced(*args, **kwargs):
+            interaction_ = _find_interaction(args)
+            if interaction_ is None:
+                return await handler(*args, **kwargs)
+
+            created = discord.utils.snowflake_time(interaction_.id).timestamp()
+            sampled = random.random() < TRACE_SAMPLE_RATE
+            trace = Trace() if sampled else None
+            warning = asyncio.get_running_loop().call_later(max(0.0, created + TRACE_DEADLINE_WARNING - time.time()),
+                                                            _warn_deadline, name, interaction_, trace, created)
+            token = _trace.set(trace)
+            try:
+                with span(name, interaction_id=interaction_.id, user_id=interaction_.user.id if interaction_.user else None,
+                          queued=round(time.time() - created, 3)):
+                    return await handler(*args, **kwargs)
+            finally:
+                warning.cancel()
+                _trace.reset(token)
+                if trace is not None:
+                    exporter.export(trace.to_dict())
+
+        return traced
+
+    return decorator
+
+
+def instrument_discord() -> None:
+    """Records the REST requests of the bot and the interaction responses as spans of the trace they are made in."""
+    def traced_request(request):
+        @functools.wraps(request)
+        async def traced(self, route, *args, **kwargs):
+            if _trace.get() is None:
+                return await request(self, route, *args, **kwargs)
+            with span(f"discord {route.method} {route.path}"):
+                return await request(self, route, *args, **kwargs)
+
+        return traced
+
+    if not getattr(discord.http.HTTPClient.request, "__traced__", False):
+        for owner in (discord.http.HTTPClient, discord.webhook.async_.AsyncWebhookAdapter):
+            owner.request = traced_request(owner.request)
+            owner.request.__traced__ = True
+
+
+class Exporter:
+    """Collects finished traces and appends them to ``path`` as JSON lines and POSTs them to ``url`` every ``interval`` seconds."""
+
+    def __init__(self, path: str | None, url: str | None, interval: float):
+        self.path = path
+        self.url = url
+        self.interval = interval
+        self._pending: list[dict[str, Any]] = []
+        self._task: asyncio.Task | None = None
+
+    def export(self, trace: dict[str, Any]) -> None:
+        if not (self.path or self.url):
+            return
+        self._pending.append(trace)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while self._pending:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to export traces")
+
+    async def flush(self) -> None:
+        traces, self._pending = self._pending, []
+        if not traces:
+            return
+        if self.path:
+            await asyncio.to_thread(self._write, traces)
+        if self.url:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(self.url, json={"traces": traces}, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                    response.raise_for_status()
+
+    def _write(self, traces: list[dict[str, Any]]) -> None:
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.writelines(json.dumps(trace) + "\n" for trace in traces)
+
+
+exporter = Exporter(TRACE_FILE, TRACE_COLLECTOR_URL, TRACE_FLUSH_INTERVAL)
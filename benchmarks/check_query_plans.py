@@ -0,0 +1,87 @@
+"""
+Runs every method in Database.INDEXED_QUERIES with the query-plan check on and fails if one of them scans a whole table.
+
+Database is imported with REMINDER_DB_EXPLAIN=1 against a scratch database holding a few thousand rows, so the plans
+are the ones SQLite picks for a populated table. Meant to run before deploying schema or query changes.
+
+    python benchmarks/check_query_plans.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ["REMINDER_DB_EXPLAIN"] = "1"
+os.environ.setdefault("REMINDER_DB_NAME", os.path.join(tempfile.mkdtemp(), "plans.db"))
+
+import pendulum  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+import Database  # noqa: E402
+from ReminderTime import ReminderTime  # noqa: E402
+
+NOW = 1_900_000_000
+
+
+async def seed():
+    async with Database.AsyncSessionMaker() as session:
+        await session.execute(insert(Database.UserDB), [{"discord_id": user_id} for user_id in range(1, 501)])
+        await session.execute(insert(Database.RemindersDB), [
+            {"user_id": 1 + i % 500, "name": f"r{i}", "channel_id": i, "timestamp": NOW + i, "next_fire_at": NOW + i, "timezone": "UTC",
+             "type": "Date", "private": False}
+            for i in range(5000)
+        ])
+        await session.execute(insert(Database.OutboxDB), [
+            {"reminder_id": 1 + i, "fire_at": NOW + i, "idempotency_key": f"{1 + i}:{NOW + i}", "attempts": 0, "next_attempt_at": NOW + i}
+            for i in range(2000)
+        ])
+        await session.commit()
+
+
+async def main():
+    await seed()
+    reminder_time = ReminderTime(unformatted_time="12:00", timezone=pendulum.timezone("UTC"), rem_type="Daily")
+    calls = {
+        "UserDB._fetch_user_timezone": lambda: Database.UserDB._fetch_user_timezone(1),
+        "UserDB.update_user_timezone": lambda: Database.UserDB.update_user_timezone(1, "UTC+3"),
+        "RemindersDB.claim_due": lambda: Database.RemindersDB.claim_due(NOW + 10, "plans", NOW + 130, limit=500),
+        "RemindersDB.set_next_fire_at": lambda: Database.RemindersDB.set_next_fire_at({1: NOW + 86400}, "plans"),
+        "RemindersDB.delete_fired": lambda: Database.RemindersDB.delete_fired({2: NOW + 1}),
+        "RemindersDB.get_upcoming": lambda: Database.RemindersDB.get_upcoming(after=NOW, until=NOW + 120),
+        "RemindersDB.get_by_ids": lambda: Database.RemindersDB.get_by_ids([3, 4, 5]),
+        "RemindersDB.add_reminder": lambda: Database.RemindersDB.add_reminder(
+            user_id=1, channel_id=1, time=reminder_time, name="plan", description=None, rem_type="Daily", link=None, file=None,
+            thumbnail=None, file_name=None, private=False, mention_role=None, limit=50),
+        "RemindersDB.get_user_reminders_count": lambda: Database.RemindersDB.get_user_reminders_count(1),
+        "RemindersDB.get_reminder_by_id": lambda: Database.RemindersDB.get_reminder_by_id(3),
+        "RemindersDB.get_user_reminders_without_file": lambda: Database.RemindersDB.get_user_reminders_without_file(1),
+        "OutboxDB.claim_ready": lambda: Database.OutboxDB.claim_ready(NOW + 10, "plans", NOW + 130, limit=500, fired_after=NOW - 300),
+        "OutboxDB.complete": lambda: Database.OutboxDB.complete([1, 2]),
+        "OutboxDB.get_next_attempt_at": lambda: Database.OutboxDB.get_next_attempt_at(after=NOW),
+        "ScheduleEventDB.get_after": lambda: Database.ScheduleEventDB.get_after(0),
+    }
+
+    failures = 0
+    for method in sorted(Database.INDEXED_QUERIES):
+        if method not in calls:
+            print(f"SKIP {method}: no call defined here")
+            continue
+        try:
+            await calls[method]()
+            print(f"  OK {method}")
+        except Database.QueryPlanError as e:
+            failures += 1
+            print(f"FAIL {e}")
+        except Database.ReminderLimitException:
+            print(f"  OK {method}")
+
+    await Database.engine.dispose()
+    if failures:
+        sys.exit(f"{failures} hot queries don't use an index")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
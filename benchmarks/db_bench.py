@@ -0,0 +1,326 @@
+"""
+Micro-benchmarks of the RemindersDB / UserDB query surface on synthetic databases of several sizes.
+
+For every scale a database is generated once (same seed, same content) into --data-dir and copied for each run, so
+runs are repeatable. Reminders are spread over 30 days with most of them on the hour and half hour, one in ten is
+Daily, and a share of them carry attachments with a log-normal size distribution, popular files shared by several
+reminders like the Attachments table deduplicates them. Each method is timed on its own and the query plan of the
+statements it runs is recorded. The dispatch cycle is timed as the dispatcher runs it: claim one minute of due
+reminders, move the Daily ones on and delete the Date ones.
+
+Results are written as JSON. --compare prints the differences between two result files and exits with 1 when a
+method got slower than --threshold times the baseline or a query plan started scanning a table it used to search.
+
+    python benchmarks/db_bench.py --scales 10000 100000 1000000 --output results.json
+    python benchmarks/db_bench.py --scales 10000 --output new.json --baseline results.json
+    python benchmarks/db_bench.py --compare results.json new.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+SEED = 20240101
+SPAN = 30 * 86400
+BASE_TIME = 1_900_000_000
+PLAN_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+class Timings:
+    """Collects the latency of every measured call and the statements the first call of each method ran."""
+
+    def __init__(self, engine):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.statements: dict[str, list[tuple[str, tuple]]] = {}
+        self._capturing: list[tuple[str, tuple]] | None = None
+
+        from sqlalchemy import event
+
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def capture(_conn, _cursor, statement, parameters, _context, executemany):
+            if self._capturing is not None and not executemany and statement.lstrip().upper().startswith(PLAN_STATEMENTS):
+                self._capturing.append((statement, tuple(parameters or ())))
+
+    @asynccontextmanager
+    async def measure(self, name: str):
+        capture = name not in self.statements
+        if capture:
+            self._capturing = self.statements[name] = []
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[name].append((time.perf_counter() - start) * 1000)
+            if capture:
+                self._capturing = None
+
+
+def summarize(samples: list[float]) -> dict:
+    quantiles = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+    return {
+        "iterations": len(samples),
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "p50_ms": round(quantiles[49], 4),
+        "p95_ms": round(quantiles[94], 4),
+        "p99_ms": round(quantiles[98], 4),
+        "min_ms": round(min(samples), 4),
+    }
+
+
+def generate(path: str, reminders: int, file_share: float):
+    """Writes a database with ``reminders`` reminders to ``path``, importing Database creates the schema."""
+    os.environ["REMINDER_DB_NAME"] = path
+    import Database
+    from constants import MAX_FILE_SIZE
+
+    rng = random.Random(SEED)
+    users = max(1, reminders // 10)
+
+    async def seed():
+        async with Database.engine.begin() as conn:
+            await conn.execute(Database.UserDB.__table__.insert(), [{"discord_id": user_id} for user_id in range(1, users + 1)])
+
+            attachments = []
+            for i in range(max(1, int(reminders * file_share) // 5)):
+                size = min(MAX_FILE_SIZE - 1, max(1024, int(rng.lognormvariate(11.9, 1.3))))
+                image = rng.random() < 0.6
+                attachments.append({"hash": f"{i:064x}", "data": rng.randbytes(size), "size": size, "ref_count": 0,
+                                    "thumbnail": rng.randbytes(rng.randrange(5_000, 20_000)) if image else None})
+
+            rows, ref_counts = [], defaultdict(int)
+            for i in range(reminders):
+                if rng.random() < 0.7:
+                    fire_at = BASE_TIME + rng.randrange(SPAN // 1800) * 1800
+                else:
+                    fire_at = BASE_TIME + rng.randrange(SPAN)
+                daily = rng.random() < 0.1
+                attachment = attachments[int(len(attachments) * rng.random() ** 2)] if rng.random() < file_share else None
+                if attachment is not None:
+                    ref_counts[attachment["hash"]] += 1
+                rows.append({
+                    "user_id": rng.randint(1, users), "name": f"reminder {i}", "channel_id": rng.randrange(10 ** 6, 10 ** 6 + users),
+                    "timestamp": fire_at % 86400 if daily else fire_at, "next_fire_at": fire_at, "timezone": "UTC",
+                    "type": "Daily" if daily else "Date", "description": "x" * rng.randrange(0, 300) or None,
+                    "file_hash": attachment["hash"] if attachment else None, "file_name": "file.png" if attachment else None,
+                    "file_size": attachment["size"] if attachment else None, "private": rng.random() < 0.2
+                })
+
+            for attachment in attachments:
+                attachment["ref_count"] = ref_counts[attachment["hash"]]
+            attachments = [attachment for attachment in attachments if attachment["ref_count"]]
+            for offset in range(0, len(attachments), 50):
+                await conn.execute(Database.AttachmentDB.__table__.insert(), attachments[offset:offset + 50])
+            for offset in range(0, len(rows), 20_000):
+                await conn.execute(Database.RemindersDB.__table__.insert(), rows[offset:offset + 20_000])
+        await Database.engine.dispose()
+
+    asyncio.run(seed())
+    # Leave a single self-contained file behind to copy
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+def run_scale(path: str, reminders: int, iterations: int, commit_window: float) -> dict:
+    """Times every method against the database at ``path`` and returns the results of this scale."""
+    os.environ["REMINDER_DB_NAME"] = path
+    import Database
+    from ReminderTime import ReminderTime
+    from constants import MAX_REMINDERS_PER_USER
+    from pendulum import Timezone
+
+    Database.writer.window = commit_window
+    timings = Timings(Database.engine)
+    rng = random.Random(SEED + 1)
+    users = max(1, reminders // 10)
+    worker_id = "bench"
+
+    async def bench():
+        for i in range(iterations):
+            user_id = rng.randint(1, users)
+
+            async with timings.measure("UserDB.create_user_if_not_exists"):
+                await Database.UserDB.create_user_if_not_exists(user_id)
+            async with timings.measure("UserDB.get_user_timezone"):
+                # The cache would hide the query
+                await Database.UserDB._fetch_user_timezone(user_id)
+            async with timings.measure("UserDB.update_user_timezone"):
+                await Database.UserDB.update_user_timezone(user_id, rng.choice(["UTC+0", "UTC+3", "UTC-5"]))
+
+            async with timings.measure("RemindersDB.get_user_reminders_count"):
+                await Database.RemindersDB.get_user_reminders_count(user_id)
+            async with timings.measure("RemindersDB.get_user_reminders_without_file"):
+                user_reminders = await Database.RemindersDB.get_user_reminders_without_file(user_id)
+            async with timings.measure("RemindersDB.get_reminder_by_id"):
+                reminder = await Database.RemindersDB.get_reminder_by_id(rng.randint(1, reminders))
+
+            if reminder is None and user_reminders:
+                reminder = user_reminders[0]
+            if reminder is not None:
+                async with timings.measure("RemindersDB.save"):
+                    await reminder.save(description=f"edited {i}")
+
+            reminder_time = ReminderTime(unformatted_time="23:59", timezone=Timezone("UTC"), rem_type="Daily")
+            async with timings.measure("RemindersDB.add_reminder"):
+                try:
+                    await Database.RemindersDB.add_reminder(user_id=user_id, channel_id=1, time=reminder_time, name="bench", description=None,
+                                                            rem_type="Daily", link=None, file=None, thumbnail=None, file_name=None,
+                                                            private=False, mention_role=None, limit=MAX_REMINDERS_PER_USER)
+                except Database.ReminderLimitException:
+                    pass
+
+            # One minute of the dispatch cycle, walking forward through the hot half-hour marks
+            until = BASE_TIME + (i // 2) * 1800 + (i % 2) * 60
+            async with timings.measure("RemindersDB.claim_due"):
+                claimed = await Database.RemindersDB.claim_due(until, worker_id, until + 120)
+            daily = {reminder.id: reminder.next_fire_at + 86400 for reminder in claimed if reminder.type == "Daily"}
+            fired = {reminder.id: reminder.next_fire_at for reminder in claimed if reminder.type == "Date"}
+            async with timings.measure("RemindersDB.set_next_fire_at"):
+                await Database.RemindersDB.set_next_fire_at(daily, worker_id)
+            async with timings.measure("RemindersDB.delete_fired"):
+                file_hashes = await Database.RemindersDB.delete_fired(fired)
+            if file_hashes:
+                await Database.AttachmentDB.free(file_hashes)
+
+        # get_schedule reads the whole table, a few runs are enough
+        for _ in range(min(iterations, 5)):
+            async with timings.measure("RemindersDB.get_schedule"):
+                await Database.RemindersDB.get_schedule()
+
+        plans = {}
+        async with Database.engine.connect() as conn:
+            for name, statements in timings.statements.items():
+                plans[name] = [
+                    [row[-1] for row in (await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)).all()]
+                    for statement, parameters in statements
+                ]
+        await Database.engine.dispose()
+        return plans
+
+    plans = asyncio.run(bench())
+    return {
+        "reminders": reminders,
+        "file_bytes": os.path.getsize(path),
+        "methods": {name: {**summarize(samples), "plan": plans.get(name, [])} for name, samples in sorted(timings.samples.items())},
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).resolve().parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def scanned_tables(plan: list[list[str]]) -> set[str]:
+    """Tables a plan reads in full, e.g. ``SCAN Reminders`` but not ``SCAN Reminders USING INDEX ...``."""
+    return {detail.split()[1] for statement in plan for detail in statement
+            if detail.startswith("SCAN ") and " USING " not in detail and len(detail.split()) > 1}
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    """Prints how ``current`` differs from ``baseline`` and returns whether anything regressed."""
+    regressed = False
+    for scale, result in current["scales"].items():
+        old_scale = baseline["scales"].get(scale)
+        if old_scale is None:
+            print(f"{scale}: not in the baseline")
+            continue
+        print(f"{scale} reminders ({baseline['meta'].get('revision')} -> {current['meta'].get('revision')})")
+        for name, method in result["methods"].items():
+            old = old_scale["methods"].get(name)
+            if old is None:
+                print(f"  {name:<45} new")
+                continue
+            ratio = method["p50_ms"] / old["p50_ms"] if old["p50_ms"] else float("inf")
+            notes = []
+            if ratio > threshold:
+                notes.append("SLOWER")
+            if method["plan"] != old["plan"]:
+                new_scans = scanned_tables(method["plan"]) - scanned_tables(old["plan"])
+                notes.append(f"PLAN SCANS {', '.join(sorted(new_scans))}" if new_scans else "plan changed")
+                regressed |= bool(new_scans)
+            regressed |= ratio > threshold
+            print(f"  {name:<45} p50 {old['p50_ms']:>9.3f} -> {method['p50_ms']:>9.3f} ms ({ratio:>5.2f}x) {' '.join(notes)}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--file-share", type=float, default=0.05, help="share of reminders with an attachment")
+    parser.add_argument("--commit-window", type=float, default=0.0,
+                        help="group commit window during the run, 0 times each write without waiting for others")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "reminder_db_bench"),
+                        help="generated databases are kept here and reused")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare the results with this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="only compare two result files")
+    parser.add_argument("--threshold", type=float, default=1.25, help="p50 ratio over the baseline that counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as baseline, open(args.compare[1]) as current:
+            sys.exit(1 if compare(json.load(baseline), json.load(current), args.threshold) else 0)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    context = multiprocessing.get_context("spawn")
+    results = {
+        "meta": {"revision": git_revision(), "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                 "platform": platform.platform(), "iterations": args.iterations, "commit_window": args.commit_window,
+                 "file_share": args.file_share, "created_at": int(time.time())},
+        "scales": {},
+    }
+
+    # Every scale runs in a fresh process, Database binds to REMINDER_DB_NAME when it is imported
+    for reminders in args.scales:
+        pristine = os.path.join(args.data_dir, f"reminders_{reminders}_{args.file_share}.db")
+        if not os.path.exists(pristine):
+            print(f"Generating {reminders} reminders into {pristine}...")
+            started = time.perf_counter()
+            process = context.Process(target=generate, args=(pristine + ".tmp", reminders, args.file_share))
+            process.start()
+            process.join()
+            if process.exitcode:
+                sys.exit(f"Generating {pristine} failed")
+            os.replace(pristine + ".tmp", pristine)
+            print(f"  done in {time.perf_counter() - started:.1f}s")
+
+        working = os.path.join(tempfile.mkdtemp(), "bench.db")
+        shutil.copyfile(pristine, working)
+        with context.Pool(1) as pool:
+            result = pool.apply(run_scale, (working, reminders, args.iterations, args.commit_window))
+        shutil.rmtree(os.path.dirname(working), ignore_errors=True)
+        results["scales"][str(reminders)] = result
+
+        print(f"{reminders} reminders ({result['file_bytes'] / 2 ** 20:.0f} MiB)")
+        for name, method in result["methods"].items():
+            print(f"  {name:<45} p50 {method['p50_ms']:>9.3f} ms  p95 {method['p95_ms']:>9.3f} ms  p99 {method['p99_ms']:>9.3f} ms")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            sys.exit(1 if compare(json.load(baseline), results, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Synthetic burst benchmark for Dispatcher delivery.
+
+Simulates N reminders becoming due at the same instant against a fake Discord that answers every send after a
+random latency and enforces the per-channel (5 per 5 s) and global (50 per s) message limits with 429s.
+Reports p50/p99 lateness (send completion minus due time) for sequential delivery and for the DeliveryPool.
+All simulated durations are divided by --time-scale so the run finishes quickly; reported numbers are rescaled back.
+
+    python benchmarks/delivery_burst.py --reminders 5000 --channels 2000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from Delivery import DeliveryPool, TokenBucket  # noqa: E402
+import constants  # noqa: E402
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float, is_global: bool):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+        self.is_global = is_global
+
+
+class FakeDiscord:
+    def __init__(self, scale: float, latency: tuple[float, float]):
+        self.scale = scale
+        self.latency = latency
+        self.requests = 0
+        self.rate_limited = 0
+        self._global = TokenBucket(50 / scale, 50)
+        self._channels: dict[int, TokenBucket] = {}
+
+    async def send(self, channel_id: int):
+        self.requests += 1
+        bucket = self._channels.setdefault(channel_id, TokenBucket(1 / self.scale, 5))
+        for limit, is_global in ((self._global, True), (bucket, False)):
+            limit._refill()
+            if limit._tokens < 1:
+                self.rate_limited += 1
+                raise RateLimited((1 - limit._tokens) / limit.rate, is_global)
+        self._global._tokens -= 1
+        bucket._tokens -= 1
+        await asyncio.sleep(random.uniform(*self.latency) * self.scale)
+
+
+def percentile(values: list[float], q: float) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+async def run_sequential(api: FakeDiscord, channels: list[int]) -> list[float]:
+    start = time.monotonic()
+    lateness = []
+    for channel_id in channels:
+        while True:
+            try:
+                await api.send(channel_id)
+                break
+            except RateLimited as e:
+                # py-cord sleeps through the 429 itself before retrying
+                await asyncio.sleep(e.retry_after)
+        lateness.append(time.monotonic() - start)
+    return lateness
+
+
+async def run_pool(api: FakeDiscord, channels: list[int]) -> list[float]:
+    scale = api.scale
+    pool = DeliveryPool(
+        workers=constants.DELIVERY_WORKERS,
+        global_rate=constants.DELIVERY_GLOBAL_RATE / scale,
+        destination_rate=constants.DELIVERY_DESTINATION_RATE / scale,
+        destination_burst=constants.DELIVERY_DESTINATION_BURST,
+        retry_after=lambda e: (e.retry_after, e.is_global) if isinstance(e, RateLimited) else None,
+        max_retries=constants.DELIVERY_MAX_RETRIES
+    )
+    start = time.monotonic()
+    lateness = []
+
+    async def job(channel_id: int):
+        await api.send(channel_id)
+        lateness.append(time.monotonic() - start)
+
+    results = await pool.run((channel_id, lambda c=channel_id: job(c)) for channel_id in channels)
+    failed = sum(isinstance(result, Exception) for result in results)
+    if failed:
+        print(f"  pool: {failed} sends failed after retries")
+    return lateness
+
+
+def report(name: str, lateness: list[float], api: FakeDiscord, scale: float):
+    lateness = [value / scale for value in lateness]
+    print(f"{name:>10}: sent={len(lateness)} p50={percentile(lateness, 50):.2f}s p99={percentile(lateness, 99):.2f}s "
+          f"max={max(lateness):.2f}s requests={api.requests} 429s={api.rate_limited}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reminders", type=int, default=5000)
+    parser.add_argument("--channels", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, nargs=2, default=(80, 150))
+    parser.add_argument("--time-scale", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    channels = [random.randrange(args.channels) for _ in range(args.reminders)]
+    latency = (args.latency_ms[0] / 1000, args.latency_ms[1] / 1000)
+
+    if not args.skip_sequential:
+        api = FakeDiscord(args.time_scale, latency)
+        report("sequential", await run_sequential(api, channels), api, args.time_scale)
+
+    api = FakeDiscord(args.time_scale, latency)
+    report("pool", await run_pool(api, channels), api, args.time_scale)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""
+Read/write throughput of the default SQLAlchemy engine versus Database.create_engine.
+
+Runs concurrent writers (one short transaction per insert, like add_reminder/save) and readers (indexed
+next_fire_at range scans on read-only connections, like the connection decorator's) against a scratch database
+for each profile and prints ops/s.
+
+    python benchmarks/engine_bench.py --seconds 10 --writers 4 --readers 16
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Importing Database initialises its own database, keep it out of the working directory
+os.environ.setdefault("REMINDER_DB_NAME", os.path.join(tempfile.mkdtemp(), "bench_init.db"))
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine  # noqa: E402
+
+import Database  # noqa: E402
+
+SCHEMA = [
+    "CREATE TABLE bench (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, next_fire_at INTEGER NOT NULL, payload TEXT)",
+    "CREATE INDEX ix_bench_next_fire_at ON bench (next_fire_at)",
+]
+
+
+async def prepare(engine, rows: int):
+    async with engine.begin() as conn:
+        for statement in SCHEMA:
+            await conn.execute(text(statement))
+        await conn.execute(
+            text("INSERT INTO bench (user_id, next_fire_at, payload) VALUES (:user_id, :next_fire_at, :payload)"),
+            [{"user_id": i % 1000, "next_fire_at": random.randrange(86400 * 30), "payload": "x" * 200} for i in range(rows)]
+        )
+
+
+async def writer(engine, deadline: float, counts: dict):
+    while time.monotonic() < deadline:
+        async with engine.begin() as conn:
+            await conn.execute(
+                text("INSERT INTO bench (user_id, next_fire_at, payload) VALUES (:user_id, :next_fire_at, 'x')"),
+                {"user_id": random.randrange(1000), "next_fire_at": random.randrange(86400 * 30)}
+            )
+        counts["writes"] += 1
+
+
+async def reader(engine, deadline: float, counts: dict):
+    while time.monotonic() < deadline:
+        start = random.randrange(86400 * 30)
+        async with engine.execution_options(read_only=True).connect() as conn:
+            await conn.execute(text("SELECT * FROM bench WHERE next_fire_at BETWEEN :a AND :b"), {"a": start, "b": start + 600})
+        counts["reads"] += 1
+
+
+async def run_profile(name: str, make_engine, args):
+    path = os.path.join(tempfile.mkdtemp(), f"{name}.db")
+    engine = make_engine(f"sqlite+aiosqlite:///{path}")
+    await prepare(engine, args.rows)
+
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    deadline = time.monotonic() + args.seconds
+
+    async def guarded(task):
+        try:
+            await task
+        except Exception:
+            counts["errors"] += 1
+
+    await asyncio.gather(*(guarded(writer(engine, deadline, counts)) for _ in range(args.writers)),
+                         *(guarded(reader(engine, deadline, counts)) for _ in range(args.readers)))
+    await engine.dispose()
+
+    print(f"{name:>8}: reads={counts['reads'] / args.seconds:,.0f}/s writes={counts['writes'] / args.seconds:,.0f}/s "
+          f"failed tasks={counts['errors']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=16)
+    args = parser.parse_args()
+
+    await run_profile("default", lambda url: create_async_engine(url), args)
+    await run_profile("tuned", lambda url: Database.create_engine(url), args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
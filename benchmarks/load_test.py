@@ -0,0 +1,279 @@
+"""
+End-to-end load test of the dispatcher against a local stand-in for the Discord REST API.
+
+The fake API answers the routes the dispatcher uses (login, channel and user lookups, DM creation, message sends),
+records every call, adds random latency, enforces Discord's per-channel message limit and injects 429s and 5xx
+errors at configurable rates. py-cord is pointed at it, the database is seeded with reminders clustered on a few
+popular minutes and the dispatcher runs in-process exactly as it does in the bot. Meanwhile simulated interactions
+exercise the same database calls as the /reminder and /timezone commands and are timed against the 3 second deadline.
+
+Reports delivery lateness (taken from the footer timestamp of every received embed), throughput, error rate,
+interaction latency and the peak RSS of the process.
+
+    python benchmarks/load_test.py --reminders 100000 --minutes 3 --interactions 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("REMINDER_DB_NAME", os.path.join(tempfile.mkdtemp(), "load_test.db"))
+os.environ.setdefault("REMINDER_METRICS_PORT", "0")
+
+import discord  # noqa: E402
+import pendulum  # noqa: E402
+from aiohttp import web  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+import Database  # noqa: E402
+from Delivery import TokenBucket  # noqa: E402
+from Dispatcher import Dispatcher, SEND_ERRORS  # noqa: E402
+from ReminderTime import ReminderTime  # noqa: E402
+from constants import UTC_ZONES  # noqa: E402
+
+BOT_ID = 1000
+
+
+def json_response(data: dict, status: int = 200, headers: dict[str, str] | None = None) -> web.Response:
+    # py-cord only parses a body sent as exactly "application/json", web.json_response appends "; charset=utf-8"
+    return web.Response(body=json.dumps(data).encode(), status=status, headers={**(headers or {}), "Content-Type": "application/json"})
+
+
+def user_payload(user_id: int, bot: bool = False) -> dict:
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0", "global_name": None, "avatar": None, "bot": bot}
+
+
+class FakeDiscord:
+    def __init__(self, latency: tuple[float, float], rate_limit_rate: float, error_rate: float):
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.calls: dict[str, int] = {}
+        self.injected_429 = 0
+        self.injected_5xx = 0
+        self.channel_limited = 0
+        self.messages = 0
+        self.lateness: list[float] = []
+        self.first_message: float | None = None
+        self.last_message: float | None = None
+        self._channels: dict[str, TokenBucket] = {}
+        self._next_id = 10 ** 17
+
+    def snowflake(self) -> str:
+        self._next_id += 1
+        return str(self._next_id)
+
+    @staticmethod
+    def rate_limited(retry_after: float) -> web.Response:
+        return json_response({"message": "You are being rate limited.", "retry_after": retry_after, "global": False}, status=429,
+                                 headers={"Retry-After": str(retry_after), "X-RateLimit-Scope": "user"})
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method, path = request.method, request.match_info["path"]
+        route = f"{method} /" + "/".join("{id}" if part.isdigit() else part for part in path.split("/"))
+        self.calls[route] = self.calls.get(route, 0) + 1
+        await asyncio.sleep(random.uniform(*self.latency))
+
+        if path == "users/@me" and method == "GET":
+            return json_response(user_payload(BOT_ID, bot=True))
+        if path == "users/@me/channels" and method == "POST":
+            recipient = (await request.json())["recipient_id"]
+            return json_response({"id": self.snowflake(), "type": 1, "recipients": [user_payload(int(recipient))]})
+        if path.startswith("users/") and method == "GET":
+            return json_response(user_payload(int(path.split("/")[1])))
+        if path.startswith("channels/") and method == "GET":
+            channel_id = path.split("/")[1]
+            return json_response({"id": channel_id, "type": 0, "guild_id": "1", "name": f"channel-{channel_id}", "position": 0,
+                                      "permission_overwrites": [], "nsfw": False, "parent_id": None})
+        if path.startswith("channels/") and path.endswith("/messages") and method == "POST":
+            return await self.create_message(request, path.split("/")[1])
+        return json_response({"message": "Unknown route", "code": 0}, status=404)
+
+    async def create_message(self, request: web.Request, channel_id: str) -> web.Response:
+        if random.random() < self.rate_limit_rate:
+            self.injected_429 += 1
+            return self.rate_limited(round(random.uniform(0.1, 1), 3))
+        if random.random() < self.error_rate:
+            self.injected_5xx += 1
+            return json_response({"message": "Internal Server Error", "code": 0}, status=random.choice([500, 502, 503]))
+
+        # Discord allows 5 messages per 5 seconds in a channel
+        bucket = self._channels.setdefault(channel_id, TokenBucket(1, 5))
+        if bucket.available < 1:
+            self.channel_limited += 1
+            return self.rate_limited(round((1 - bucket._tokens) / bucket.rate, 3))
+        bucket.take(1)
+
+        if request.content_type == "multipart/form-data":
+            payload = json.loads((await request.post())["payload_json"])
+        else:
+            payload = await request.json()
+
+        now = time.time()
+        self.messages += 1
+        self.first_message = self.first_message or now
+        self.last_message = now
+        for embed in payload.get("embeds", []):
+            if "timestamp" in embed:
+                self.lateness.append(now - datetime.fromisoformat(embed["timestamp"]).timestamp())
+
+        return json_response({
+            "id": self.snowflake(), "channel_id": channel_id, "author": user_payload(BOT_ID, bot=True), "content": payload.get("content") or "",
+            "timestamp": datetime.now().astimezone().isoformat(), "edited_timestamp": None, "tts": False, "mention_everyone": False,
+            "mentions": [], "mention_roles": [], "attachments": [], "embeds": payload.get("embeds", []), "pinned": False, "type": 0,
+            "nonce": payload.get("nonce")
+        })
+
+    async def start(self) -> tuple[web.AppRunner, str]:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/api/v10/{path:.*}", self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return runner, f"http://127.0.0.1:{port}/api/v10"
+
+
+async def seed(reminders: int, users: int, channels: int, minutes: int, start: int) -> list[int]:
+    """Inserts reminders due over the next ``minutes``, most of them exactly on a handful of popular minutes."""
+    popular = [start + 60 * (minute + 1) for minute in range(minutes)]
+    # Channel popularity follows a power law, a few busy channels get most reminders
+    channel_ids = [10 ** 6 + int(channels * random.random() ** 3) for _ in range(reminders)]
+    fire_times = []
+    rows = []
+    for i in range(reminders):
+        fire_at = random.choice(popular) if random.random() < 0.7 else start + random.randrange(60 * minutes)
+        fire_times.append(fire_at)
+        rows.append({
+            "user_id": 1 + i % users, "name": f"load {i}", "channel_id": channel_ids[i], "timestamp": fire_at, "next_fire_at": fire_at,
+            "timezone": "UTC", "type": "Date", "description": "Load test reminder", "private": random.random() < 0.1
+        })
+
+    async with Database.AsyncSessionMaker() as session:
+        await session.execute(insert(Database.UserDB).prefix_with("OR IGNORE"), [{"discord_id": 1 + i} for i in range(users)])
+        for offset in range(0, len(rows), 10000):
+            await session.execute(insert(Database.RemindersDB), rows[offset:offset + 10000])
+        await session.commit()
+    return fire_times
+
+
+async def simulate_interactions(rate: float, users: int, stop: asyncio.Event, latencies: list[float]):
+    """Runs the database calls of /reminder create, the edit page and /timezone set at ``rate`` per second."""
+    zones = list(UTC_ZONES)
+
+    async def create(user_id: int):
+        async with Database.unit_of_work():
+            await Database.UserDB.create_user_if_not_exists(user_id)
+            zone = await Database.UserDB.get_user_timezone(user_id)
+            time_ = ReminderTime(unformatted_time="23:59", timezone=pendulum.timezone(UTC_ZONES[zone]), rem_type="Daily")
+            rem_id = await Database.RemindersDB.add_reminder(user_id=user_id, channel_id=1, time=time_, name="interaction", description=None,
+                                                    rem_type="Daily", link=None, file=None, thumbnail=None, file_name=None, private=True,
+                                                    mention_role=None, limit=1000)
+        await Dispatcher.schedule(rem_id, time_.fire_at)
+
+    async def edit(user_id: int):
+        reminders = await Database.RemindersDB.get_user_reminders_without_file(user_id)
+        if reminders:
+            await reminders[0].save(description=f"edited {time.time()}")
+
+    async def set_timezone(user_id: int):
+        async with Database.unit_of_work():
+            await Database.UserDB.create_user_if_not_exists(user_id)
+            await Database.UserDB.update_user_timezone(user_id, random.choice(zones))
+
+    async def one():
+        started = time.perf_counter()
+        try:
+            await random.choice([create, edit, set_timezone])(random.randint(1, users))
+        except Database.ReminderLimitException:
+            pass
+        latencies.append(time.perf_counter() - started)
+
+    tasks = set()
+    while not stop.is_set():
+        task = asyncio.create_task(one())
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        await asyncio.sleep(random.expovariate(rate))
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def percentile(values: list[float], q: int) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] if len(values) > 1 else (values[0] if values else 0.0)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reminders", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--channels", type=int, default=5_000)
+    parser.add_argument("--minutes", type=int, default=3, help="reminders are due over this many minutes")
+    parser.add_argument("--latency", type=float, nargs=2, default=(0.02, 0.15), metavar=("MIN", "MAX"))
+    parser.add_argument("--rate-limits", type=float, default=0.01, help="share of sends answered with an injected 429")
+    parser.add_argument("--errors", type=float, default=0.005, help="share of sends answered with a 5xx")
+    parser.add_argument("--interactions", type=float, default=10, help="simulated interactions per second")
+    parser.add_argument("--timeout", type=float, default=1800, help="give up after this many seconds")
+    args = parser.parse_args()
+
+    api = FakeDiscord(tuple(args.latency), args.rate_limits, args.errors)
+    runner, base_url = await api.start()
+    discord.http.Route.base = property(lambda _route: base_url)
+
+    start = int(time.time())
+    print(f"Seeding {args.reminders} reminders into {os.environ['REMINDER_DB_NAME']}...")
+    fire_times = await seed(args.reminders, args.users, args.channels, args.minutes, start)
+    last_fire = max(fire_times)
+
+    client = discord.Client(intents=discord.Intents.none())
+    await client.login("load-test")
+    Dispatcher.bot = client
+    dispatcher = asyncio.create_task(Dispatcher.run())
+
+    stop = asyncio.Event()
+    interaction_latencies: list[float] = []
+    interactions = asyncio.create_task(simulate_interactions(args.interactions, args.users, stop, interaction_latencies))
+
+    deadline = time.time() + args.timeout
+    while len(api.lateness) < args.reminders and time.time() < deadline:
+        await asyncio.sleep(1)
+        print(f"\r{len(api.lateness)}/{args.reminders} delivered, {api.messages} messages", end="", flush=True)
+    print()
+
+    stop.set()
+    await interactions
+    dispatcher.cancel()
+    await asyncio.gather(dispatcher, return_exceptions=True)
+    await client.close()
+    await runner.cleanup()
+
+    requests = sum(api.calls.values())
+    sends = api.messages + api.injected_429 + api.injected_5xx + api.channel_limited
+    duration = (api.last_message or time.time()) - (api.first_message or start)
+    print(f"delivered: {len(api.lateness)}/{args.reminders} in {api.messages} messages, last due {last_fire - start}s after start")
+    if api.lateness:
+        print(f"lateness: p50={percentile(api.lateness, 50):.2f}s p99={percentile(api.lateness, 99):.2f}s max={max(api.lateness):.2f}s")
+    print(f"throughput: {len(api.lateness) / max(duration, 1e-9):.1f} reminders/s, {api.messages / max(duration, 1e-9):.1f} messages/s")
+    print(f"requests: {requests} ({', '.join(f'{route}: {count}' for route, count in sorted(api.calls.items()))})")
+    print(f"errors: {api.injected_429} injected 429, {api.injected_5xx} injected 5xx, {api.channel_limited} channel limit 429 "
+          f"of {sends} sends ({(sends - api.messages) / max(sends, 1):.2%}); "
+          f"dispatcher saw {sum(SEND_ERRORS._values.values())} failed sends")
+    if interaction_latencies:
+        late = sum(latency > 3 for latency in interaction_latencies)
+        print(f"interactions: {len(interaction_latencies)}, p50={percentile(interaction_latencies, 50) * 1000:.1f}ms "
+              f"p99={percentile(interaction_latencies, 99) * 1000:.1f}ms, {late} over the 3s deadline")
+    print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
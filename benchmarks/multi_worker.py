@@ -0,0 +1,126 @@
+"""
+Runs several dispatcher processes against one SQLite file and checks the lease-based claim protocol.
+
+The database is seeded with reminders due over the next few seconds, then every worker runs
+Dispatcher.check_reminders with Discord replaced by a fake send that logs ``worker, reminder name``.
+With --kill the first worker hard-exits after a few sends while still holding its claims; the others must
+take those reminders over once the lease runs out. At the end the log is checked for missed reminders and for
+duplicates, which are only allowed for reminders the killed worker had sent but not yet completed.
+
+    python benchmarks/multi_worker.py --workers 4 --reminders 2000 --kill
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+LEASE = 5
+HEARTBEAT = 1
+
+# Importing Database runs asyncio.run(init_db()), so it has to happen here and not inside a coroutine. The
+# settings are read at import, the spawned workers inherit them and import this module again with the same ones
+os.environ.setdefault("REMINDER_DB_NAME", os.path.join(tempfile.mkdtemp(), "reminders.db"))
+os.environ["REMINDER_LEASE"] = str(LEASE)
+
+import Database  # noqa: E402
+import Dispatcher as dispatcher_module  # noqa: E402
+from Dispatcher import Dispatcher  # noqa: E402
+
+
+def worker_main(worker_id: str, log_path: str, duration: float, kill_after: int | None):
+    dispatcher_module.DISPATCHER_WORKER_ID = worker_id
+    dispatcher_module.DISPATCH_HEARTBEAT = HEARTBEAT
+    sent = 0
+
+    async def fake_send(cls, reminder, parts, nonce):
+        nonlocal sent
+        await asyncio.sleep(random.uniform(0.001, 0.01))
+        with open(log_path, "a") as log:
+            log.writelines(f"{worker_id}\t{part.name}\n" for part in parts)
+        sent += len(parts)
+        if kill_after is not None and sent >= kill_after:
+            os._exit(1)
+
+    Dispatcher.send_batch = classmethod(fake_send)
+
+    async def run():
+        try:
+            await asyncio.wait_for(Dispatcher.check_reminders(), timeout=duration)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(run())
+
+
+async def seed(reminders: int, spread: float) -> dict[str, int]:
+    now = time.time()
+    async with Database.AsyncSessionMaker() as session:
+        session.add(Database.UserDB(discord_id=1))
+        await session.flush()
+        rows = [
+            Database.RemindersDB(user_id=1, name=f"r{i}", channel_id=i % 50, timestamp=0,
+                                 next_fire_at=int(now + random.uniform(0, spread)), timezone="UTC",
+                                 type="Daily" if i % 10 == 0 else "Date", private=False)
+            for i in range(reminders)
+        ]
+        session.add_all(rows)
+        await session.commit()
+        names = {row.name: row.id for row in rows}
+    await Database.engine.dispose()
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--reminders", type=int, default=2000)
+    parser.add_argument("--spread", type=float, default=5, help="reminders become due over this many seconds")
+    parser.add_argument("--duration", type=float, default=20, help="seconds every worker runs for")
+    parser.add_argument("--kill", action="store_true", help="crash the first worker after a few sends")
+    args = parser.parse_args()
+
+    log_path = os.path.join(os.path.dirname(Database.DATABASE_NAME), "sends.log")
+    names = asyncio.run(seed(args.reminders, args.spread))
+    expected = set(names.values())
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=worker_main, args=(f"worker-{i}", log_path, args.duration,
+                                                  25 if args.kill and i == 0 else None))
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    sends = defaultdict(list)
+    with open(log_path) as log:
+        for line in log:
+            worker_id, name = line.split()
+            sends[names[name]].append(worker_id)
+
+    per_worker = Counter(worker_id for workers in sends.values() for worker_id in workers)
+    missed = expected - sends.keys()
+    duplicates = {rem_id: workers for rem_id, workers in sends.items() if len(workers) > 1}
+    unexpected = {rem_id: workers for rem_id, workers in duplicates.items() if not (args.kill and workers[0] == "worker-0")}
+
+    for worker_id, count in sorted(per_worker.items()):
+        print(f"{worker_id}: {count} sends")
+    print(f"missed: {len(missed)}, duplicates: {len(duplicates)} (after crash takeover: {len(duplicates) - len(unexpected)})")
+    if missed or unexpected:
+        print(f"FAILED: missed={sorted(missed)[:20]} unexpected duplicates={dict(list(unexpected.items())[:20])}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
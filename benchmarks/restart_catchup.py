@@ -0,0 +1,169 @@
+"""
+Checks that reminders missed while the dispatcher was down are sent once it is back, in virtual time.
+
+The dispatcher runs for --before days, is stopped for --downtime hours and then starts again like a fresh process
+would: a new in-memory schedule loaded from next_fire_at, nothing else carried over. Discord is replaced by a fake
+send that records the virtual time of every part.
+
+Checked at the end:
+  - every occurrence due while the dispatcher ran was sent once, at most --max-late seconds late;
+  - every Date reminder due during the downtime was sent once after the restart;
+  - every Daily reminder that missed occurrences during the downtime was sent once for the first of them after the
+    restart, the others were skipped, and it went back to its wall-clock time afterwards;
+  - nothing was sent twice.
+
+    python benchmarks/restart_catchup.py --before 1 --downtime 50 --after 1
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("REMINDER_DB_NAME", os.path.join(tempfile.mkdtemp(), "restart.db"))
+os.environ.setdefault("REMINDER_METRICS_PORT", "0")
+
+import pendulum  # noqa: E402
+
+import Clock  # noqa: E402
+import Database  # noqa: E402
+import Dispatcher as dispatcher_module  # noqa: E402
+from Dispatcher import Dispatcher  # noqa: E402
+from ReminderTime import ReminderTime  # noqa: E402
+from Scheduler import Scheduler  # noqa: E402
+from common import next_daily_fire_at  # noqa: E402
+from constants import UTC_ZONES  # noqa: E402
+
+DAILY_TIMES = ["00:00", "06:15", "12:00", "23:59"]
+ZONES = ["UTC+0", "UTC+3", "UTC-5", "UTC+9"]
+USER_ID = 1
+
+
+async def seed(days: float, date_reminders: int) -> dict[str, tuple]:
+    """Creates the reminders at the start time, returns ``name -> (type, seconds of day or fire_at, zone)``."""
+    await Database.UserDB.create_user_if_not_exists(USER_ID)
+    created = {}
+
+    async def create(name: str, time_: str, zone: str, rem_type: str) -> ReminderTime:
+        reminder_time = ReminderTime(unformatted_time=time_, timezone=pendulum.timezone(UTC_ZONES[zone]), rem_type=rem_type)
+        await Database.RemindersDB.add_reminder(user_id=USER_ID, channel_id=1, time=reminder_time, name=name, description=None,
+                                                rem_type=rem_type, link=None, file=None, thumbnail=None, file_name=None,
+                                                private=False, mention_role=None)
+        return reminder_time
+
+    for zone in ZONES:
+        for time_ in DAILY_TIMES:
+            name = f"daily {zone} {time_}"
+            reminder_time = await create(name, time_, zone, "Daily")
+            created[name] = ("Daily", reminder_time.bd_timestamp, reminder_time.timezone.name)
+    for i in range(date_reminders):
+        minutes = random.randrange(2, int(days * 1440) - 60)
+        name = f"date {i}"
+        reminder_time = await create(name, f"{minutes // 1440}d {minutes // 60 % 24}h {minutes % 60}m", "UTC+0", "Date")
+        created[name] = ("Date", reminder_time.fire_at, None)
+
+    await Database.engine.dispose()
+    return created
+
+
+async def run_dispatcher(seconds: float, sends: list[tuple[str, int, float]]) -> None:
+    async def fake_send(cls, reminder, parts, nonce):
+        sends.extend((part.name, part.fire_at, Clock.timestamp()) for part in parts)
+
+    Dispatcher.send_batch = classmethod(fake_send)
+    # A restarted process starts with an empty schedule, check_reminders loads it from the database
+    Dispatcher.scheduler = Scheduler()
+    task = asyncio.create_task(Dispatcher.check_reminders())
+    await asyncio.sleep(seconds)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await Database.engine.dispose()
+
+
+def check(created: dict[str, tuple], sends: list[tuple[str, int, float]], start: float, down: float, up: float, end: float,
+          max_late: float) -> list[str]:
+    problems = []
+    sent = defaultdict(list)
+    for name, fire_at, sent_at in sends:
+        sent[name].append((fire_at, sent_at))
+
+    for name, (rem_type, when, zone) in created.items():
+        fired = sorted(sent.get(name, []))
+        if len({fire_at for fire_at, _ in fired}) != len(fired):
+            problems.append(f"{name}: an occurrence was sent twice {fired}")
+
+        if rem_type == "Date":
+            occurrences = [when] if when < end - 60 else []
+        else:
+            occurrences, after = [], int(start)
+            while (fire_at := next_daily_fire_at(when, zone, after=after)) < end - 60:
+                occurrences.append(fire_at)
+                after = fire_at
+
+        missed = [fire_at for fire_at in occurrences if down < fire_at <= up]
+        expected = [fire_at for fire_at in occurrences if fire_at <= down or fire_at > up] + missed[:1]
+        if [fire_at for fire_at, _ in fired] != sorted(expected):
+            problems.append(f"{name}: sent {[fire_at for fire_at, _ in fired]}, expected {sorted(expected)}")
+            continue
+
+        for fire_at, sent_at in fired:
+            if fire_at in missed and sent_at < up:
+                problems.append(f"{name}: missed occurrence {fire_at} sent at {sent_at:.0f} while the dispatcher was down")
+            elif fire_at not in missed and sent_at - fire_at > max_late:
+                problems.append(f"{name}: due {pendulum.from_timestamp(fire_at)} sent {sent_at - fire_at:.0f}s late")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--start", default="2025-03-05", help="UTC date the virtual clock starts at")
+    parser.add_argument("--before", type=float, default=1, help="days the dispatcher runs before it goes down")
+    parser.add_argument("--downtime", type=float, default=50, help="hours the dispatcher is down")
+    parser.add_argument("--after", type=float, default=1, help="days the dispatcher runs after the restart")
+    parser.add_argument("--date-reminders", type=int, default=500)
+    parser.add_argument("--max-late", type=float, default=5, help="seconds after its fire time an on-time reminder may be sent")
+    parser.add_argument("--heartbeat", type=float, default=3600,
+                        help="dispatcher heartbeat in virtual seconds, the heap wakes it up for every due reminder anyway")
+    args = parser.parse_args()
+
+    dispatcher_module.DISPATCH_HEARTBEAT = args.heartbeat
+
+    start = pendulum.parse(args.start, tz="UTC").timestamp()
+    # Off the minute, so no reminder is due exactly when the dispatcher stops or starts
+    down = start + args.before * 86400 + 7
+    up = down + args.downtime * 3600
+    end = up + args.after * 86400
+    sends: list[tuple[str, int, float]] = []
+
+    clock = Clock.VirtualClock(start)
+    previous = Clock.use(clock)
+    try:
+        created = asyncio.run(seed((end - start) / 86400, args.date_reminders))
+    finally:
+        Clock.use(previous)
+
+    Clock.run_virtual(run_dispatcher(down - start, sends), clock)
+    # Down: time passes and nothing runs
+    clock.advance(up - down)
+    before_restart = len(sends)
+    Clock.run_virtual(run_dispatcher(end - up, sends), clock)
+
+    problems = check(created, sends, start, down, up, end, args.max_late)
+    caught_up = sum(down < fire_at <= up for _, fire_at, _ in sends)
+    print(f"{len(created)} reminders, {before_restart} sends before the downtime, {len(sends) - before_restart} after the restart "
+          f"of which {caught_up} for occurrences missed while down")
+    for problem in problems[:50]:
+        print(f"  {problem}")
+    if problems:
+        print(f"FAILED: {len(problems)} problems")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
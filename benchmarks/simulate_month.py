@@ -0,0 +1,157 @@
+"""
+Replays weeks of dispatching in virtual time and checks that every reminder fired when it should have.
+
+The reminders are created first, at the start time of a virtual clock that stands still. Then Dispatcher.check_reminders
+runs on a Clock.VirtualEventLoop, so the clock jumps from one wake-up to the next instead of waiting for it, with
+Discord replaced by a fake send that records the virtual time of every part. The clock doesn't move while a database
+call is running on its thread. Daily reminders are created through ReminderTime in zones with DST at times around
+midnight and inside the DST gap and overlap, Date reminders with timer durations spread over the whole run. The
+default start covers the US and EU spring changes.
+
+Checked at the end: every Daily reminder fired exactly once on every local day at its wall-clock time (or just after
+the gap on the day that time doesn't exist), every Date reminder fired exactly once, nothing fired more than --max-late
+seconds late.
+
+    python benchmarks/simulate_month.py --days 30 --start 2025-03-05 --date-reminders 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("REMINDER_DB_NAME", os.path.join(tempfile.mkdtemp(), "simulation.db"))
+os.environ.setdefault("REMINDER_METRICS_PORT", "0")
+
+import pendulum  # noqa: E402
+
+import Clock  # noqa: E402
+import Database  # noqa: E402
+import Dispatcher as dispatcher_module  # noqa: E402
+from Dispatcher import Dispatcher  # noqa: E402
+from ReminderTime import ReminderTime  # noqa: E402
+from constants import UTC_ZONES  # noqa: E402
+
+DAILY_TIMES = ["00:00", "00:30", "01:30", "02:30", "03:00", "12:00", "23:30", "23:59"]
+USER_ID = 1
+
+
+async def create(name: str, time_: str, zone: str, rem_type: str) -> int:
+    reminder_time = ReminderTime(unformatted_time=time_, timezone=pendulum.timezone(UTC_ZONES[zone]), rem_type=rem_type)
+    return await Database.RemindersDB.add_reminder(user_id=USER_ID, channel_id=1, time=reminder_time, name=name, description=None,
+                                                   rem_type=rem_type, link=None, file=None, thumbnail=None, file_name=None,
+                                                   private=False, mention_role=None)
+
+
+async def seed(days: int, date_reminders: int) -> dict[str, tuple[str, str, str]]:
+    """Creates the reminders at the start time, the dispatcher loads them with the rest of the schedule."""
+    await Database.UserDB.create_user_if_not_exists(USER_ID)
+
+    created = {}
+    for zone in sorted(set(UTC_ZONES)):
+        for time_ in DAILY_TIMES:
+            name = f"daily {zone} {time_}"
+            await create(name, time_, zone, "Daily")
+            created[name] = ("Daily", zone, time_)
+    for i in range(date_reminders):
+        minutes = random.randrange(2, days * 1440 - 60)
+        name = f"date {i}"
+        await create(name, f"{minutes // 1440}d {minutes // 60 % 24}h {minutes % 60}m", "UTC+0", "Date")
+        created[name] = ("Date", "UTC+0", "")
+
+    # The pool must not carry connections over to the virtual event loop
+    await Database.engine.dispose()
+    return created
+
+
+async def simulate(days: int, sends: list[tuple[str, int, float]]) -> None:
+    async def fake_send(cls, reminder, parts, nonce):
+        sends.extend((part.name, part.fire_at, Clock.timestamp()) for part in parts)
+
+    Dispatcher.send_batch = classmethod(fake_send)
+    task = asyncio.create_task(Dispatcher.check_reminders())
+    await asyncio.sleep(days * 86400)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def check(created: dict[str, tuple[str, str, str]], sends: list[tuple[str, int, float]], start: float, end: float, max_late: float) -> list[str]:
+    problems = []
+    by_name = defaultdict(list)
+    for name, fire_at, sent_at in sends:
+        by_name[name].append((fire_at, sent_at))
+        if sent_at - fire_at > max_late:
+            problems.append(f"{name}: due {pendulum.from_timestamp(fire_at)} sent {sent_at - fire_at:.0f}s late")
+
+    for name, (rem_type, zone, time_) in created.items():
+        fired = sorted(by_name.get(name, []))
+        if rem_type == "Date":
+            if len(fired) != 1:
+                problems.append(f"{name}: fired {len(fired)} times")
+            continue
+
+        tz = UTC_ZONES[zone]
+        hour, minute = map(int, time_.split(":"))
+        per_day = defaultdict(list)
+        for fire_at, _ in fired:
+            per_day[pendulum.from_timestamp(fire_at, tz=tz).date()].append(fire_at)
+
+        # Every local day whose occurrence was due inside the run, skipping the partial first and last day
+        day = pendulum.from_timestamp(start, tz=tz).start_of("day").add(days=1)
+        while day.add(days=1).timestamp() < end - 60:
+            fires = per_day.get(day.date(), [])
+            wall = pendulum.datetime(day.year, day.month, day.day, hour, minute, tz=tz)
+            if len(fires) != 1:
+                problems.append(f"{name}: fired {len(fires)} times on {day.date()}")
+            elif (wall.hour, wall.minute) == (hour, minute) and fires[0] != wall.int_timestamp:
+                problems.append(f"{name}: fired at {pendulum.from_timestamp(fires[0], tz=tz)} on {day.date()}")
+            day = day.add(days=1)
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--start", default="2025-03-05", help="UTC date the virtual clock starts at")
+    parser.add_argument("--date-reminders", type=int, default=2000)
+    parser.add_argument("--max-late", type=float, default=5, help="seconds after its fire time a reminder counts as late")
+    parser.add_argument("--heartbeat", type=float, default=3600,
+                        help="dispatcher heartbeat in virtual seconds, the heap wakes it up for every due reminder anyway")
+    args = parser.parse_args()
+
+    dispatcher_module.DISPATCH_HEARTBEAT = args.heartbeat
+    start = pendulum.parse(args.start, tz="UTC").timestamp()
+    end = start + args.days * 86400
+    sends: list[tuple[str, int, float]] = []
+
+    clock = Clock.VirtualClock(start)
+    previous = Clock.use(clock)
+    try:
+        created = asyncio.run(seed(args.days, args.date_reminders))
+    finally:
+        Clock.use(previous)
+
+    started = time.perf_counter()
+    Clock.run_virtual(simulate(args.days, sends), clock)
+    elapsed = time.perf_counter() - started
+
+    problems = check(created, sends, start, end, args.max_late)
+    lateness = sorted(sent_at - fire_at for _, fire_at, sent_at in sends)
+    print(f"{args.days} virtual days in {elapsed:.1f}s: {len(created)} reminders, {len(sends)} sends, "
+          f"max lateness {lateness[-1] if lateness else 0:.1f}s")
+    for problem in problems[:50]:
+        print(f"  {problem}")
+    if problems:
+        print(f"FAILED: {len(problems)} problems")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
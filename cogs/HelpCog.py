@@ -4,6 +4,7 @@ import discord
 import pendulum
 from discord.ext import commands
 
+import Tracing
 import constants
 
 
@@ -17,6 +18,7 @@ class HelpCog(commands.Cog):
         name="timezones",
         description="Information about the time zones",
     )
+    @Tracing.interaction("/help timezones")
     async def timezone_help_cmd(self,
                                 ctx: discord.ApplicationContext,
                                 ):
@@ -43,6 +45,7 @@ class HelpCog(commands.Cog):
         name="time_formats",
         description="Information about the time formats",
     )
+    @Tracing.interaction("/help time_formats")
     async def timezone_help_cmd(self,
                                 ctx: discord.ApplicationContext,
                                 ):
@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime
 from typing import Literal
 
@@ -7,11 +8,13 @@ from discord.ext import commands
 from pendulum import Timezone
 
 import Database
+import Tracing
 import constants
+from Dispatcher import Dispatcher
 from ReminderEditPage import ReminderEditEmbed, ReminderListView
 from ReminderTime import TimeInPastException, ExcessiveFutureTimeException, InvalidReminderTypeException, InvalidTimeFormatException, ReminderTime
-from common import can_user_tag_role
-from constants import UTC_ZONES, MAX_FILE_SIZE, SUCCESS_MESSAGE_COLOR
+from common import can_user_tag_role, is_embed_image, make_thumbnail
+from constants import UTC_ZONES, MAX_FILE_SIZE, MAX_REMINDERS_PER_USER, SUCCESS_MESSAGE_COLOR
 
 
 class ReminderCog(commands.Cog):
@@ -92,6 +95,7 @@ class ReminderCog(commands.Cog):
         description="The role mentioned in the reminder; if none, the author will be mentioned. Does not work in DMs.",
         required=False
     )
+    @Tracing.interaction("/reminder create")
     async def create_cmd(self,
                          ctx: discord.ApplicationContext,
                          name: str,
@@ -119,22 +123,31 @@ class ReminderCog(commands.Cog):
             if file.size >= MAX_FILE_SIZE:
                 return await self._send_error(ctx, "Max file size is 10MB")
 
-            file_data = await file.read()
+            with Tracing.span("file.read", size=file.size):
+                file_data = await file.read()
             file_name = file.filename
+            with Tracing.span("make_thumbnail"):
+                thumbnail = await asyncio.to_thread(make_thumbnail, file_data) if is_embed_image(file_name) else None
         else:
             file_data = None
             file_name = None
+            thumbnail = None
 
-        await Database.UserDB.create_user_if_not_exists(ctx.user.id)
+        try:
+            # One transaction: the user row, the limit check and the insert commit together
+            async with Database.unit_of_work():
+                await Database.UserDB.create_user_if_not_exists(ctx.user.id)
 
-        if await Database.RemindersDB.get_user_reminders_count(ctx.user.id) == 50:
-            return await self._send_error(ctx, "The limit for reminders is 50. Please delete some reminders to create a new one.")
+                utc_zone = await Database.UserDB.get_user_timezone(ctx.user.id)
+                timezone = Timezone(UTC_ZONES[utc_zone])
 
-        utc_zone = (await Database.UserDB.get_user_timezone(ctx.user.id)).tz_name
-        timezone = Timezone(UTC_ZONES[utc_zone])
+                with Tracing.span("ReminderTime"):
+                    reminder_time = ReminderTime(unformatted_time=time, timezone=timezone, rem_type=rem_type)
 
-        try:
-            reminder_time = ReminderTime(unformatted_time=time, timezone=timezone, rem_type=rem_type)
+                reminder_id = await Database.RemindersDB.add_reminder(user_id=ctx.user.id, time=reminder_time, name=name, description=description,
+                                                                      rem_type=rem_type, link=link, file=file_data, thumbnail=thumbnail, file_name=file_name,
+                                                                      private=is_private, mention_role=mention_role.id if mention_role else None,
+                                                                      channel_id=ctx.channel.id, limit=MAX_REMINDERS_PER_USER)
 
         except TimeInPastException:
             return await self._send_error(ctx, "The specified time is in the past", True)
@@ -148,9 +161,10 @@ class ReminderCog(commands.Cog):
         except InvalidTimeFormatException:
             return await self._send_error(ctx, "The specified time format cannot be parsed", True)
 
-        await Database.RemindersDB.add_reminder(user_id=ctx.user.id, time=reminder_time, name=name, description=description,
-                                                rem_type=rem_type, link=link, file=file_data, file_name=file_name, private=is_private,
-                                                mention_role=mention_role.id if mention_role else None, channel_id=ctx.channel.id)
+        except Database.ReminderLimitException:
+            return await self._send_error(ctx, f"The limit for reminders is {MAX_REMINDERS_PER_USER}. Please delete some reminders to create a new one.")
+
+        await Dispatcher.schedule(reminder_id, reminder_time.fire_at)
 
         embed = discord.Embed(title=f"Reminder \"{name}\" created!", color=SUCCESS_MESSAGE_COLOR)
 
@@ -171,6 +185,7 @@ class ReminderCog(commands.Cog):
         name="edit",
         description="Edit or view active reminders.",
     )
+    @Tracing.interaction("/reminder edit")
     async def edit_cmd(self, ctx: discord.ApplicationContext):
         reminders = await Database.RemindersDB.get_user_reminders_without_file(ctx.user.id)
         if not reminders:
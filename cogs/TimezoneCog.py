@@ -3,6 +3,7 @@ import pendulum
 from discord.ext import commands
 
 import Database
+import Tracing
 
 from constants import UTC_ZONES
 
@@ -24,13 +25,15 @@ class TimezoneCog(commands.Cog):
         description="The UTC timezone",
         autocomplete=discord.utils.basic_autocomplete(_utc_zones_keys)
     )
+    @Tracing.interaction("/timezone")
     async def timezone_cmd(self,
                            ctx: discord.ApplicationContext,
                            timezone: str,
                            ):
 
-        await Database.UserDB.create_user_if_not_exists(ctx.user.id)
-        await Database.UserDB.update_user_timezone(ctx.user.id, timezone)
+        async with Database.unit_of_work():
+            await Database.UserDB.create_user_if_not_exists(ctx.user.id)
+            await Database.UserDB.update_user_timezone(ctx.user.id, timezone)
 
         embed = discord.Embed(
             title="Your timezone has been changed",
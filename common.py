@@ -1,16 +1,59 @@
+import io
 from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+
 import pendulum
+from PIL import Image
 from discord import Permissions
 
+from constants import EMBED_IMAGE_TYPES, THUMBNAIL_SIZE
+
+
+def calculate_timestamp_for_discord_footer(fire_at: int) -> datetime:
+    return datetime.fromtimestamp(fire_at)
+
+def next_daily_fire_at(seconds_of_day: int, timezone: str, after: int) -> int:
+    """
+    Returns the first epoch strictly after ``after`` at which the wall clock in ``timezone`` shows ``seconds_of_day``,
+    or the first moment after the DST gap on a day that time doesn't exist.
+    """
+    # Built from the date, set() and start_of() move a time inside the gap back to the previous day
+    day = pendulum.from_timestamp(after, tz=timezone).date()
+    while True:
+        fire_at = pendulum.datetime(day.year, day.month, day.day, seconds_of_day // 3600, seconds_of_day // 60 % 60,
+                                    seconds_of_day % 60, tz=timezone)
+        if fire_at.int_timestamp > after:
+            return fire_at.int_timestamp
+        day = day.add(days=1)
+
+def is_embed_image(file_name: str) -> bool:
+    return file_name.split(".")[-1].lower() in EMBED_IMAGE_TYPES
+
+def make_thumbnail(data: bytes) -> bytes | None:
+    """Downscales an image to fit into ``THUMBNAIL_SIZE`` pixels and encodes it as WebP; ``None`` if it can't be decoded."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = image.convert("RGBA") if image.mode not in ("RGB", "RGBA") else image
+            image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            output = io.BytesIO()
+            image.save(output, format="WEBP", quality=80)
+            return output.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+def format_file_size(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
 
-def calculate_timestamp_for_discord_footer(timestamp: int, reminder_type: str) -> datetime:
-    if reminder_type == "Daily":
-        timestamp = pendulum.now("UTC").replace(
-            hour=timestamp // 3600,
-            minute=timestamp // 60 % 60,
-            second=timestamp % 60
-        ).timestamp()
-    return datetime.fromtimestamp(timestamp)
+def cdn_url_expires_at(url: str) -> int | None:
+    """Returns the epoch at which a signed Discord CDN URL stops working, from its hex ``ex`` parameter."""
+    expires = parse_qs(urlparse(url).query).get("ex")
+    try:
+        return int(expires[0], 16) if expires else None
+    except ValueError:
+        return None
 
 def can_user_tag_role(is_role_mentionable: bool, guild_permissions: Permissions) -> bool:
-    return is_role_mentionable or guild_permissions.mention_everyone or guild_permissions.administrator
\ No newline at end of file
+    return is_role_mentionable or guild_permissions.mention_everyone or guild_permissions.administrator
@@ -1,4 +1,6 @@
+import os
 import re
+import socket
 
 # Time patterns
 HH_MM_pattern: re.Pattern = re.compile(r"^(?:[01]?[0-9]|2[0-3]):([0-5][0-9])$")
@@ -57,9 +59,90 @@ REMINDER_MESSAGE_COLOR = 0xB991FF   # Reminder message color
 # Allowed embedded image types
 EMBED_IMAGE_TYPES = {"png", "jpg", "jpeg", "webp", "gif", "tiff", "ico"}
 
+# Image previews on the reminder edit page
+THUMBNAIL_SIZE = 320                  # Maximum width and height of a preview (in pixels)
+THUMBNAIL_FILE_NAME = "preview.webp"  # File name previews are uploaded with
+
 # Reminder settings
-DISPATCHER_PERIOD = 20     # How often reminders are fetched from the database (in seconds)
-MAX_FILE_SIZE = 10485760   # Maximum file size that can be attached to a reminder
+MAX_FILE_SIZE = 10485760       # Maximum file size that can be attached to a reminder
+MAX_REMINDERS_PER_USER = 50    # Maximum number of reminders a user can have at once
+CDN_URL_REFRESH_MARGIN = 3600  # Stored CDN links expiring within this time are signed again by Discord before reuse (in seconds)
+CDN_URL_REFRESH_BATCH = 50     # Most CDN links refreshed in one request
+DISPATCH_HEARTBEAT = 60        # How often due reminders are claimed without a wake-up (in seconds)
+
+# Dispatcher settings, several dispatcher processes can share one database
+DISPATCHER_WORKER_ID = os.getenv("REMINDER_WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"  # Owner of claimed reminders
+DISPATCHER_LEASE = int(os.getenv("REMINDER_LEASE", 120))                 # Seconds a claim lasts before another worker may take over
+DISPATCHER_CLAIM_BATCH = int(os.getenv("REMINDER_CLAIM_BATCH", 500))     # Most reminders claimed at once
+DISPATCHER_MODE = os.getenv("REMINDER_DISPATCHER", "embedded")           # "external": the bot leaves sending to worker.py
+SCHEDULE_EVENT_POLL = float(os.getenv("REMINDER_EVENT_POLL", 1))         # Seconds between checks for schedule changes
+SCHEDULE_EVENT_RETENTION = 3600                                          # Schedule change events are kept this long (in seconds)
+
+# Delivery settings
+DELIVERY_WORKERS = 16               # How many reminders are sent concurrently
+DELIVERY_GLOBAL_RATE = 45           # Requests per second across all destinations (Discord's global limit is 50)
+DELIVERY_DESTINATION_RATE = 1       # Messages per second to a single channel or DM once its burst is used up
+DELIVERY_DESTINATION_BURST = 5      # Messages that can be sent to a single channel or DM at once
+DELIVERY_MAX_RETRIES = 3            # How many times a rate-limited (429) send is retried
+DELIVERY_INFLIGHT_BYTES = 67108864  # Maximum attachment bytes held in memory by sends in progress
+DELIVERY_SEND_TIMEOUT = 30          # Seconds a single send may take before it is retried later
+DELIVERY_MAX_ATTEMPTS = 8           # Failed sends are retried until this many attempts, then dropped
+DELIVERY_BACKOFF_BASE = 5           # Delay before the first retry, doubled with every further attempt (in seconds)
+DELIVERY_BACKOFF_CAP = 3600         # Longest delay between retries (in seconds)
+
+# Discord message limits, reminders for the same destination are packed into one message within them
+MESSAGE_MAX_EMBEDS = 10             # Embeds per message
+MESSAGE_MAX_EMBED_CHARS = 6000      # Characters across all embeds of a message
+MESSAGE_MAX_FILES = 10              # Files per message
+MESSAGE_MAX_UPLOAD = 26214400       # Bytes of files per message
+
+# Look-ahead settings, messages of reminders due soon are built before they fire
+PRERENDER_WINDOW = 120       # How far ahead reminders are prepared (in seconds)
+PRERENDER_INTERVAL = 30      # How often upcoming reminders are looked up (in seconds)
+PRERENDER_CACHE_SIZE = 5000  # Most prepared messages kept at once
 
-# Database Settings
-DATABASE_NAME = "database.db"
\ No newline at end of file
+# Metrics settings, served by the process that runs the dispatcher
+METRICS_HOST = os.getenv("REMINDER_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("REMINDER_METRICS_PORT", 9464))  # /metrics and /healthz, 0 turns the endpoint off. One port per dispatcher process
+METRICS_STALL_AFTER = 300                                     # /healthz fails when no dispatch tick completed for this long (in seconds)
+
+# Tracing settings, spans of slash commands and component callbacks with their database calls and Discord requests
+TRACE_SAMPLE_RATE = float(os.getenv("REMINDER_TRACE_SAMPLE_RATE", 0))  # Share of interactions traced, 0 turns tracing off
+TRACE_FILE = os.getenv("REMINDER_TRACE_FILE", "traces.jsonl")          # Sampled traces are appended here as JSON lines, empty to skip
+TRACE_COLLECTOR_URL = os.getenv("REMINDER_TRACE_COLLECTOR_URL")        # Sampled traces are also POSTed here as JSON, if set
+TRACE_FLUSH_INTERVAL = 5                                               # How often finished traces are written out (in seconds)
+TRACE_DEADLINE_WARNING = 2.5                                           # Handlers that haven't responded this long after the interaction was created are logged, Discord allows 3 seconds
+
+# Recipient settings
+RECIPIENT_CACHE_SIZE = 10000    # How many resolved channels and users the dispatcher keeps
+RECIPIENT_CACHE_TTL = 3600      # How long a resolved channel or user is reused (in seconds)
+RECIPIENT_NEGATIVE_TTL = 600    # How long a missing or forbidden channel or user is not asked for again (in seconds)
+RECIPIENT_MAX_FAILURES = 3      # A reminder is disabled after this many deliveries in a row failed for good
+
+# Backlog settings, applied to reminders that couldn't be sent on time (e.g. while the bot was offline)
+BACKLOG_LATE_THRESHOLD = 300                                   # Reminders sent later than this are marked late and drained slowly (in seconds)
+BACKLOG_DRAIN_RATE = 5                                         # Late reminders sent per second, least late first
+BACKLOG_DRAIN_BURST = 50                                       # Late reminders that can be sent at once
+BACKLOG_POLICY = os.getenv("REMINDER_BACKLOG_POLICY", "send")  # For reminders older than BACKLOG_MAX_AGE: "send", "drop" or "summarize"
+BACKLOG_MAX_AGE = 21600                                        # Age from which BACKLOG_POLICY applies (in seconds)
+BACKLOG_SUMMARY_LINES = 20                                     # Most reminders listed one by one in a summary
+
+# Database Settings, each can be overridden with the environment variable named in the call
+DATABASE_NAME = os.getenv("REMINDER_DB_NAME", "database.db")
+DATABASE_POOL_SIZE = int(os.getenv("REMINDER_DB_POOL_SIZE", 5))         # Connections kept open in the pool
+DATABASE_POOL_OVERFLOW = int(os.getenv("REMINDER_DB_POOL_OVERFLOW", 15)) # Extra connections opened under load, one per concurrent reader
+DATABASE_PRAGMAS = {                                                    # Applied to every new connection
+    "journal_mode": os.getenv("REMINDER_DB_JOURNAL_MODE", "WAL"),       # Readers don't block the writer
+    "synchronous": os.getenv("REMINDER_DB_SYNCHRONOUS", "NORMAL"),      # Durable in WAL mode except on power loss
+    "busy_timeout": int(os.getenv("REMINDER_DB_BUSY_TIMEOUT", 5000)),   # Milliseconds to wait for a lock
+    # Opt-in only, a large cache on every pooled connection made reads slower than SQLite's defaults
+    **({"cache_size": int(os.getenv("REMINDER_DB_CACHE_SIZE"))} if os.getenv("REMINDER_DB_CACHE_SIZE") else {}),  # Page cache per connection, negative is KiB
+    **({"mmap_size": int(os.getenv("REMINDER_DB_MMAP_SIZE"))} if os.getenv("REMINDER_DB_MMAP_SIZE") else {}),     # Bytes of the file read through mmap
+    **({"temp_store": os.getenv("REMINDER_DB_TEMP_STORE")} if os.getenv("REMINDER_DB_TEMP_STORE") else {}),       # e.g. MEMORY
+}
+DATABASE_GROUP_COMMIT_WINDOW = float(os.getenv("REMINDER_DB_GROUP_COMMIT_WINDOW", 0.005))  # Seconds writes wait to share a commit
+DATABASE_GROUP_COMMIT_MAX = int(os.getenv("REMINDER_DB_GROUP_COMMIT_MAX", 256))            # Most writes committed together
+DATABASE_PROFILE = os.getenv("REMINDER_DB_PROFILE", "0") == "1"                            # Collect call statistics of every database method
+DATABASE_SLOW_QUERY = float(os.getenv("REMINDER_DB_SLOW_QUERY", 0.25))                     # Profiled calls slower than this are logged with their SQL (in seconds)
+DATABASE_EXPLAIN = os.getenv("REMINDER_DB_EXPLAIN", "0") == "1"                            # Check the query plan of every statement, for tests
+USER_TIMEZONE_CACHE_SIZE = 10000  # How many users' time zones are kept in memory
\ No newline at end of file
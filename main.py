@@ -1,20 +1,27 @@
-import asyncio
 import os
 
 from dotenv import load_dotenv
 import discord
 
+# Database settings are read from the environment when the modules below are imported
+load_dotenv()
+
 bot = discord.Bot(intents=discord.Intents.all())
 
+import Tracing
 from Dispatcher import Dispatcher
+from constants import DISPATCHER_MODE
 
 Dispatcher.bot = bot
+# In external mode reminders are sent by worker.py, this process only publishes schedule changes for it
+Dispatcher.publish_events = DISPATCHER_MODE == "external"
+# Discord requests made while handling a sampled interaction show up in its trace
+Tracing.instrument_discord()
 
 @bot.event
 async def on_ready():
-    asyncio.create_task(Dispatcher.check_reminders())
-
-load_dotenv()
+    if not Dispatcher.publish_events:
+        Dispatcher.start()
 
 bot.load_extension("cogs.ReminderCog")
 bot.load_extension("cogs.TimezoneCog")
@@ -0,0 +1,31 @@
+import asyncio
+import logging
+import os
+
+from dotenv import load_dotenv
+import discord
+
+# Database settings are read from the environment when the modules below are imported
+load_dotenv()
+
+from Dispatcher import Dispatcher
+
+
+async def main(token: str):
+    # Sending only needs the REST API, so no gateway connection is opened and the bot process keeps its event loop
+    client = discord.Client(intents=discord.Intents.none())
+    await client.login(token)
+    Dispatcher.bot = client
+    try:
+        await Dispatcher.run_standalone()
+    finally:
+        await client.close()
+
+
+token = os.getenv("REMINDER_BOT_TOKEN")
+
+if not token:
+    raise ValueError("REMINDER_BOT_TOKEN environment variable not set")
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+asyncio.run(main(token))